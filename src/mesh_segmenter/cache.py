@@ -0,0 +1,115 @@
+import hashlib
+import logging
+import os
+import tempfile
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from typing import Optional, Union
+
+import numpy as np
+
+from mesh_segmenter.graph import DualGraph
+from mesh_segmenter.progress import NO_PROGRESS, ProgressHook
+from mesh_segmenter.utils.mesh import Mesh
+from mesh_segmenter.utils.constants import DELTA, ETA
+
+
+class GraphCache:
+    """LRU cache of dual graphs, keyed by the mesh content and parameters.
+
+    Distances of every graph are computed within the memory budget, so the
+    full cache holds up to max_size times the budget.
+    """
+
+    def __init__(
+        self, max_size: int = 4, memory_budget: Optional[int] = None
+    ) -> None:
+        self._max_size = max_size
+        self._memory_budget = memory_budget
+        self._graphs: OrderedDict[tuple, DualGraph] = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self) -> int:
+        return len(self._graphs)
+
+    def get(
+        self,
+        mesh: Mesh,
+        delta: float = DELTA,
+        eta: float = ETA,
+        num_workers: int = 1,
+        progress: ProgressHook = NO_PROGRESS,
+    ) -> tuple[DualGraph, bool]:
+        """Cached dual graph for the mesh and whether it was a cache hit."""
+        key = (mesh.content_hash(), delta, eta)
+        with self._lock:
+            if key in self._graphs:
+                self._graphs.move_to_end(key)
+                self.hits += 1
+                return self._graphs[key], True
+
+        dual_graph = DualGraph(
+            mesh,
+            num_workers=num_workers,
+            delta=delta,
+            eta=eta,
+            memory_budget=self._memory_budget,
+            progress=progress,
+        )
+        with self._lock:
+            self.misses += 1
+            self._graphs[key] = dual_graph
+            while len(self._graphs) > self._max_size:
+                self._graphs.popitem(last=False)
+        logging.info(f"Graph cache: {self.hits} hits, {self.misses} misses")
+
+        return dual_graph, False
+
+
+class NodeCache:
+    """Memberships of segmentation tree nodes on disk, shared by runs.
+
+    Keys are built by the caller from the mesh content, the dual graph,
+    the segmenter parameters and the faces of the node, so a deeper run
+    finds the upper levels of an earlier one here.
+    """
+
+    def __init__(self, directory: Path) -> None:
+        self._directory = directory
+        self._directory.mkdir(parents=True, exist_ok=True)
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def key(*parts: Union[str, bytes]) -> str:
+        digest = hashlib.sha1()
+        for part in parts:
+            digest.update(part.encode() if isinstance(part, str) else part)
+            digest.update(b";")
+
+        return digest.hexdigest()
+
+    def _path(self, key: str) -> Path:
+        return self._directory / key[:2] / f"{key}.npy"
+
+    def get(self, key: str) -> Optional[np.ndarray]:
+        path = self._path(key)
+        if not path.exists():
+            self.misses += 1
+            return None
+
+        self.hits += 1
+        return np.load(path)
+
+    def put(self, key: str, probs: np.ndarray) -> None:
+        path = self._path(key)
+        path.parent.mkdir(exist_ok=True)
+        # Concurrent runs never see a partially written file
+        with tempfile.NamedTemporaryFile(
+            dir=path.parent, suffix=".tmp", delete=False
+        ) as tmp_file:
+            np.save(tmp_file, probs)
+        os.replace(tmp_file.name, path)
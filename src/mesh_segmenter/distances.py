@@ -0,0 +1,353 @@
+import logging
+import os
+import shutil
+import tempfile
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from typing import Callable, Optional, Union
+
+import numpy as np
+
+from mesh_segmenter.utils.constants import (
+    ARC_NUM_BYTES,
+    HEAT_TIME_FACTOR,
+    LAZY_MAX_FACES,
+    NUM_LANDMARKS,
+    DistanceBackend,
+)
+
+ROW_BYTES = np.dtype(np.float64).itemsize
+
+
+class DenseDistances:
+    """All-pairs distances of a connected component, kept in RAM."""
+
+    def __init__(self, size: int) -> None:
+        self._rows = np.full((size, size), np.inf)
+
+    @property
+    def size(self) -> int:
+        return len(self._rows)
+
+    def set_row(self, idx: int, row: np.ndarray) -> None:
+        self._rows[idx] = row
+
+    def row(self, idx: int) -> np.ndarray:
+        return self._rows[idx]
+
+    def get(self, idx_one: int, idx_two: int) -> float:
+        return float(self._rows[idx_one, idx_two])
+
+
+class MemmapDistances(DenseDistances):
+    """All-pairs distances in a temporary file, paged in by the OS."""
+
+    def __init__(self, size: int, directory: Optional[Path] = None) -> None:
+        with tempfile.NamedTemporaryFile(
+            dir=directory, suffix=".dist", delete=False
+        ) as dist_file:
+            path = dist_file.name
+        self._rows = np.memmap(
+            path, dtype=np.float64, mode="w+", shape=(size, size)
+        )
+        self._rows[:] = np.inf
+        # Mapping stays valid, disk space is freed with the last reference
+        os.unlink(path)
+
+
+class CheckpointedDistances(DenseDistances):
+    """All-pairs distances in a file, which outlives the process.
+
+    A progress index next to the file marks the rows already on disk, a
+    restarted run computes only the missing ones. Rows are marked by
+    checkpoint, after the file is flushed, so the index never runs ahead.
+    """
+
+    def __init__(self, path: Path, size: int) -> None:
+        self._index_path = path.with_suffix(".index.npy")
+        resume = path.exists() and self._index_path.exists()
+        self._rows = np.memmap(
+            path,
+            dtype=np.float64,
+            mode="r+" if resume else "w+",
+            shape=(size, size),
+        )
+        if resume:
+            self._done = np.load(self._index_path)
+        else:
+            self._rows[:] = np.inf
+            self._done = np.zeros(size, dtype=bool)
+        self._pending: list[np.ndarray] = []
+
+    @property
+    def missing_rows(self) -> np.ndarray:
+        return np.flatnonzero(~self._done)
+
+    def mark_done(self, rows: np.ndarray) -> None:
+        """Rows are written, they are marked at the next checkpoint."""
+        self._pending.append(rows)
+
+    def checkpoint(self) -> None:
+        if not self._pending:
+            return
+
+        self._rows.flush()
+        self._done[np.concatenate(self._pending)] = True
+        self._pending = []
+        # Index is replaced atomically, a killed run leaves the old one
+        tmp_path = self._index_path.with_suffix(".tmp.npy")
+        np.save(tmp_path, self._done)
+        os.replace(tmp_path, self._index_path)
+
+
+class LazyDistances:
+    """Distance rows computed on demand, the most recent ones are cached."""
+
+    def __init__(
+        self,
+        size: int,
+        compute_row: Callable[[int], np.ndarray],
+        max_rows: int,
+    ) -> None:
+        self._size = size
+        self._compute_row = compute_row
+        self._max_rows = max(2, max_rows)
+        self._rows: OrderedDict[int, np.ndarray] = OrderedDict()
+        self._lock = threading.Lock()
+
+    @property
+    def size(self) -> int:
+        return self._size
+
+    def row(self, idx: int) -> np.ndarray:
+        with self._lock:
+            if idx in self._rows:
+                self._rows.move_to_end(idx)
+                return self._rows[idx]
+
+        row = self._compute_row(idx)
+        with self._lock:
+            self._rows[idx] = row
+            while len(self._rows) > self._max_rows:
+                self._rows.popitem(last=False)
+
+        return row
+
+    def get(self, idx_one: int, idx_two: int) -> float:
+        return float(self.row(idx_one)[idx_two])
+
+
+class HeatDistances(LazyDistances):
+    """Heat method distances over the dual graph, rows on demand.
+
+    Heat from the source face is diffused for a short time, the direction
+    of its decrease along every arc is integrated back into distances by a
+    Poisson solve. Both sparse systems are factorized once, so every row
+    costs 2 back-substitutions.
+    """
+
+    def __init__(
+        self,
+        size: int,
+        arcs: tuple[np.ndarray, np.ndarray, np.ndarray],
+        max_rows: int,
+        time_factor: float = HEAT_TIME_FACTOR,
+    ) -> None:
+        super().__init__(size, compute_row=self._solve, max_rows=max_rows)
+        self._arcs_one, self._arcs_two, lengths = arcs
+        self._lengths = np.maximum(lengths, np.finfo(np.float64).tiny)
+        if size == 1 or not len(self._lengths):
+            self._heat = self._poisson = None
+            return
+
+        try:
+            from scipy import sparse
+            from scipy.sparse.linalg import splu
+        except ImportError as err:
+            raise ImportError(
+                "Heat distances need scipy, install it with pip install scipy"
+            ) from err
+
+        # Graph Laplacian with 1 / length^2 conductances
+        conductance = 1.0 / self._lengths**2
+        adjacency = sparse.coo_matrix(
+            (conductance, (self._arcs_one, self._arcs_two)), shape=(size, size)
+        ).tocsr()
+        adjacency = adjacency + adjacency.T
+        laplacian = (
+            sparse.diags(np.asarray(adjacency.sum(axis=1)).ravel()) - adjacency
+        )
+        identity = sparse.identity(size)
+        heat_time = time_factor * self._lengths.mean() ** 2
+        self._heat = splu((identity + heat_time * laplacian).tocsc())
+        # Laplacian is singular, distances are defined up to a constant
+        regularization = 1e-10 * laplacian.diagonal().mean()
+        self._poisson = splu((laplacian + regularization * identity).tocsc())
+
+    def _solve(self, idx: int) -> np.ndarray:
+        if self._heat is None:
+            row = np.full(self._size, np.inf)
+            row[idx] = 0.0
+            return row
+
+        source = np.zeros(self._size)
+        source[idx] = 1.0
+        heat = self._heat.solve(source)
+        # Unit steps along arcs, pointing away from the source
+        steps = -np.sign(heat[self._arcs_two] - heat[self._arcs_one])
+        flow = steps / self._lengths
+        divergence = np.bincount(
+            self._arcs_two, weights=flow, minlength=self._size
+        ) - np.bincount(self._arcs_one, weights=flow, minlength=self._size)
+        row = self._poisson.solve(divergence)
+        return np.maximum(row - row[idx], 0.0)
+
+
+class ApproximateDistances:
+    """Landmark upper bounds, d(i, j) <= min_k d(i, k) + d(k, j).
+
+    Landmarks are chosen by farthest point sampling, distances from the
+    landmarks themselves are exact.
+    """
+
+    def __init__(
+        self,
+        size: int,
+        compute_row: Callable[[int], np.ndarray],
+        num_landmarks: int,
+    ) -> None:
+        num_landmarks = max(1, min(num_landmarks, size))
+        self._landmarks = np.empty((num_landmarks, size))
+        closest = np.full(size, np.inf)
+        landmark = 0
+        for idx in range(num_landmarks):
+            self._landmarks[idx] = compute_row(landmark)
+            closest = np.minimum(closest, self._landmarks[idx])
+            # Next one is the farthest reachable face from chosen landmarks
+            reachable = np.where(np.isfinite(closest), closest, -1.0)
+            landmark = int(np.argmax(reachable))
+
+    @property
+    def size(self) -> int:
+        return self._landmarks.shape[1]
+
+    @property
+    def num_landmarks(self) -> int:
+        return len(self._landmarks)
+
+    def row(self, idx: int) -> np.ndarray:
+        row = (self._landmarks[:, idx, None] + self._landmarks).min(axis=0)
+        row[idx] = 0.0
+        return row
+
+    def get(self, idx_one: int, idx_two: int) -> float:
+        if idx_one == idx_two:
+            return 0.0
+
+        return float(
+            (self._landmarks[:, idx_one] + self._landmarks[:, idx_two]).min()
+        )
+
+
+DistanceStore = Union[
+    DenseDistances,
+    MemmapDistances,
+    CheckpointedDistances,
+    LazyDistances,
+    HeatDistances,
+    ApproximateDistances,
+]
+
+
+def available_memory() -> int:
+    """Available RAM in bytes."""
+    try:
+        with open("/proc/meminfo") as meminfo:
+            for line in meminfo:
+                if line.startswith("MemAvailable:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+
+    return os.sysconf("SC_AVPHYS_PAGES") * os.sysconf("SC_PAGE_SIZE")
+
+
+def parse_memory_size(size: str) -> int:
+    """Parse sizes like 512M, 2G or 1073741824 into bytes."""
+    units = {"K": 1024, "M": 1024**2, "G": 1024**3, "T": 1024**4}
+    size = size.strip().upper().removesuffix("B")
+    if size and size[-1] in units:
+        return int(float(size[:-1]) * units[size[-1]])
+
+    return int(size)
+
+
+def select_distance_backend(
+    component_sizes: list[int],
+    num_arcs: int,
+    memory_budget: Optional[int] = None,
+    directory: Optional[Path] = None,
+) -> tuple[DistanceBackend, int]:
+    """Choose a distance backend and the RAM it may use for distances.
+
+    Dense in RAM if all-pairs blocks fit the budget, otherwise on disk if
+    they fit there, otherwise rows on demand, and landmark approximations
+    for the meshes too large to recompute rows.
+    """
+    budget = available_memory()
+    if memory_budget is not None:
+        budget = min(budget, memory_budget)
+    # Dual graph itself stays in RAM whatever the backend
+    budget = max(0, budget - num_arcs * ARC_NUM_BYTES)
+
+    num_faces = sum(component_sizes)
+    dense_bytes = sum(size**2 for size in component_sizes) * ROW_BYTES
+    free_disk = shutil.disk_usage(directory or tempfile.gettempdir()).free
+    if dense_bytes <= budget:
+        backend = DistanceBackend.dense
+    elif dense_bytes <= free_disk:
+        backend = DistanceBackend.memmap
+    elif num_faces <= LAZY_MAX_FACES:
+        backend = DistanceBackend.lazy
+    else:
+        backend = DistanceBackend.approximate
+
+    logging.info(
+        f"Distance backend: {backend}, all-pairs distances need"
+        f" {dense_bytes / 1024**2:.1f}MB, budget {budget / 1024**2:.1f}MB,"
+        f" free disk {free_disk / 1024**2:.1f}MB"
+    )
+    return backend, budget
+
+
+def create_distance_store(
+    backend: DistanceBackend,
+    size: int,
+    compute_row: Callable[[int], np.ndarray],
+    budget: int,
+    num_faces: int,
+    directory: Optional[Path] = None,
+    arcs: Optional[tuple[np.ndarray, np.ndarray, np.ndarray]] = None,
+) -> DistanceStore:
+    """Empty store for dense backends, filled one for the others."""
+    if backend == DistanceBackend.dense:
+        return DenseDistances(size)
+
+    if backend == DistanceBackend.memmap:
+        return MemmapDistances(size, directory=directory)
+
+    # Budget is shared by the components proportionally to their size
+    row_budget = budget * size / max(1, num_faces)
+    max_rows = int(row_budget // (size * ROW_BYTES))
+    if backend == DistanceBackend.lazy:
+        return LazyDistances(size, compute_row=compute_row, max_rows=max_rows)
+
+    if backend == DistanceBackend.heat:
+        return HeatDistances(size, arcs=arcs, max_rows=max_rows)
+
+    return ApproximateDistances(
+        size,
+        compute_row=compute_row,
+        num_landmarks=min(NUM_LANDMARKS, max_rows),
+    )
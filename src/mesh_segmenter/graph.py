@@ -1,16 +1,44 @@
+import copy
+import hashlib
+import json
 import logging
-import heapq
 import multiprocessing
+import time
 from concurrent.futures import ThreadPoolExecutor
-from typing import Union, Type
+from functools import cached_property, partial
+from pathlib import Path
+from typing import TYPE_CHECKING, Optional, Union, Type
 from collections import defaultdict
 from dataclasses import dataclass
 
-import tqdm
+import numpy as np
 
-from mesh_segmenter.utils.mesh import Mesh, Face
-from mesh_segmenter.utils.utils import angular_distance, geodesic_distance
-from mesh_segmenter.utils.constants import DELTA, DIST_N_SMALLEST
+from mesh_segmenter.distances import (
+    CheckpointedDistances,
+    DistanceStore,
+    create_distance_store,
+    select_distance_backend,
+)
+from mesh_segmenter.progress import NO_PROGRESS, ProgressHook, stage, track
+from mesh_segmenter.shortest_paths import (
+    CsrGraph,
+    dijkstra_row,
+    distance_rows,
+    scipy_dijkstra_rows,
+)
+from mesh_segmenter.utils.mesh import Mesh, Face, Vertex
+from mesh_segmenter.utils.utils import angular_features, geodesic_distance
+from mesh_segmenter.utils.constants import (
+    CHECKPOINT_ROWS,
+    DELTA,
+    DIJKSTRA_BATCH_SIZE,
+    ETA,
+    DistanceBackend,
+    ShortestPaths,
+)
+
+if TYPE_CHECKING:
+    from mesh_segmenter.sharding import ShardedDistances
 
 
 @dataclass
@@ -25,15 +53,46 @@ class GraphEdge:
         return False
 
 
-@dataclass(frozen=True)
-class HeapNode:
-    distance: float
-    face: Face
+def convex_scaled(
+    ang_dists: np.ndarray, convex: np.ndarray, eta: float = ETA
+) -> np.ndarray:
+    """Angular distances with the ones of convex arcs scaled by eta."""
+    return np.where(convex, eta * ang_dists, ang_dists)
 
-    def __lt__(self, other: Type["HeapNode"]) -> bool:
-        if self.distance != other.distance:
-            return self.distance < other.distance
-        return False
+
+def arc_weights(
+    ang_dists: np.ndarray,
+    convex: np.ndarray,
+    geod_dists: np.ndarray,
+    delta: float = DELTA,
+    eta: float = ETA,
+) -> np.ndarray:
+    """Vectorized arc weights from the raw per-arc features."""
+    ang_dists = convex_scaled(ang_dists, convex=convex, eta=eta)
+    ang = (1 - delta) * ang_dists / ang_dists.mean()
+    geod = delta * geod_dists / geod_dists.mean()
+    return ang + geod
+
+
+def _shortest_paths_backend(
+    shortest_paths: Optional[ShortestPaths], dist_n_smallest: Optional[int]
+) -> ShortestPaths:
+    """scipy shortest paths if installed, heap ones if pruning is needed."""
+    if shortest_paths == ShortestPaths.scipy and dist_n_smallest is not None:
+        raise ValueError("scipy shortest paths do not support dist_n_smallest")
+
+    if shortest_paths is not None:
+        return shortest_paths
+
+    if dist_n_smallest is None:
+        try:
+            import scipy.sparse.csgraph  # noqa: F401
+        except ImportError:
+            pass
+        else:
+            return ShortestPaths.scipy
+
+    return ShortestPaths.heap
 
 
 class DualGraph:
@@ -42,144 +101,523 @@ class DualGraph:
     def __init__(
         self,
         mesh: Mesh,
-        dist_n_smallest=DIST_N_SMALLEST,
+        dist_n_smallest: Optional[int] = None,
         num_workers=multiprocessing.cpu_count(),
+        delta: float = DELTA,
+        eta: float = ETA,
+        calculate_distances: bool = True,
+        memory_budget: Optional[int] = None,
+        distance_backend: Optional[DistanceBackend] = None,
+        distances_dir: Optional[Path] = None,
+        progress: ProgressHook = NO_PROGRESS,
+        shortest_paths: Optional[ShortestPaths] = None,
+        sharded: Optional["ShardedDistances"] = None,
+        checkpoint_dir: Optional[Path] = None,
+        checkpoint_rows: int = CHECKPOINT_ROWS,
     ) -> None:
         # Vertices and neighbours
         self._num_workers = num_workers
-        # Weighted graph of connected faces
-        self._graph: dict[Face, dict[Face, GraphEdge]] = defaultdict(dict)
-        # Keep track for weight
-        self._ang_dists: list[float] = []
-        self._geod_dists: list[float] = []
+        self._progress = progress
+        # Raw features, one entry per arc, weights are derived from them
+        self._arcs: np.ndarray = np.empty((0, 2), dtype=np.int64)
+        self._ang_dists: np.ndarray = np.empty(0)
+        self._convex: np.ndarray = np.empty(0, dtype=bool)
+        self._geod_dists: np.ndarray = np.empty(0)
+        self._weights: np.ndarray = np.empty(0)
+        # Connected components: label per face, face ids per component and
+        # position of each face inside its component
+        self._face_ids: dict[Face, int] = {}
+        self._components: np.ndarray = np.empty(0, dtype=np.int64)
+        self._component_faces: list[np.ndarray] = []
+        self._local_ids: np.ndarray = np.empty(0, dtype=np.int64)
+        self._component_arc_ids: list[np.ndarray] = []
+        self._delta = delta
+        self._eta = eta
         self._mesh: Mesh = mesh
-        # Distances
-        self._dist_n_smallest: int = dist_n_smallest
-        self._distance: dict[Face, Face] = {}
+        # Distances, exact unless only dist_n_smallest nearest neighbours
+        # of every face are relaxed
+        self._dist_n_smallest = dist_n_smallest
+        self._shortest_paths = _shortest_paths_backend(
+            shortest_paths, dist_n_smallest
+        )
+        # Rows are computed by worker processes if given, possibly remote
+        self._sharded = sharded
+        # Dense distances are kept there to resume killed runs, if given
+        self._checkpoint_dir = checkpoint_dir
+        self._checkpoint_rows = checkpoint_rows
+        self._rows_since_checkpoint = 0
+        self._checkpoint_seconds = 0.0
+        # Component subgraphs in local face ids, derived from the weights
+        self._csr: list[CsrGraph] = []
+        # One distance store per connected component, backend is chosen
+        # from the memory budget, unless given explicitly
+        self._memory_budget = memory_budget
+        self._distance_backend = distance_backend
+        self._distances_dir = distances_dir
+        self._distance: list[DistanceStore] = []
+        self._backend: Optional[DistanceBackend] = None
+        # RAM for distances the backend was chosen with
+        self._budget: Optional[int] = None
         self._create_graph()
+        self._label_components()
         self._calculate_weights()
-        self._calculate_distances()
+        if calculate_distances:
+            self._calculate_distances()
 
-    @property
+    # Weighted graph of connected faces, built on first use from the arcs
+    @cached_property
     def graph(self) -> dict[Face, dict[Face, GraphEdge]]:
-        return self._graph
+        faces = self._mesh.faces
+        ang_dists = convex_scaled(
+            self._ang_dists, convex=self._convex, eta=self._eta
+        )
+        graph: dict[Face, dict[Face, GraphEdge]] = defaultdict(dict)
+        for (idx_one, idx_two), ang, geod, weight in zip(
+            self._arcs.tolist(),
+            ang_dists.tolist(),
+            self._geod_dists.tolist(),
+            self._weights.tolist(),
+        ):
+            face_one, face_two = faces[idx_one], faces[idx_two]
+            graph[face_one][face_two] = GraphEdge(
+                ang_distance=ang, geod_distance=geod, weight=weight
+            )
+            graph[face_two][face_one] = GraphEdge(
+                ang_distance=ang, geod_distance=geod, weight=weight
+            )
+
+        return graph
+
+    @property
+    def num_arcs(self) -> int:
+        return len(self._arcs)
+
+    @property
+    def num_components(self) -> int:
+        return len(self._component_faces)
+
+    @property
+    def delta(self) -> float:
+        return self._delta
+
+    @property
+    def eta(self) -> float:
+        return self._eta
 
     def get_distance(
         self, face_one: Face, face_two: Face
     ) -> Union[None, float]:
-        if face_one not in self._distance:
+        idx_one = self._face_ids.get(face_one)
+        if idx_one is None or not self._distance:
             return None
 
-        if face_two not in self._distance[face_one]:
+        idx_two = self._face_ids.get(face_two)
+        if idx_two is None:
+            return float("infinity")
+
+        component = self._components[idx_one]
+        if component != self._components[idx_two]:
             return float("infinity")
 
-        return self._distance[face_one][face_two]
+        return self._distance[component].get(
+            self._local_ids[idx_one], self._local_ids[idx_two]
+        )
+
+    def face_ids(self, faces: list[Face]) -> np.ndarray:
+        """Ids of the faces in the dual graph."""
+        return np.array([self._face_ids[face] for face in faces], dtype=int)
+
+    def distances_from(self, face_id: int, face_ids: np.ndarray) -> np.ndarray:
+        """Distances from one face to many, all given by their ids."""
+        component = self._components[face_id]
+        row = self._distance[component].row(self._local_ids[face_id])
+        distances = np.full(len(face_ids), np.inf)
+        same = self._components[face_ids] == component
+        distances[same] = row[self._local_ids[face_ids[same]]]
+        return distances
+
+    def split_components(self, faces: list[Face]) -> list[list[Face]]:
+        """Group faces by the connected component they belong to."""
+        groups: dict[int, list[Face]] = defaultdict(list)
+        for face in faces:
+            groups[self._components[self._face_ids[face]]].append(face)
+
+        return list(groups.values())
+
+    def subgraph_arcs(
+        self, faces: list[Face]
+    ) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """Arcs between the given faces and their weights.
+
+        Arc ends are positions of the faces in the given list.
+        """
+        local_ids = np.full(self._mesh.num_faces, -1, dtype=np.int64)
+        local_ids[[self._face_ids[face] for face in faces]] = np.arange(
+            len(faces)
+        )
+        arcs = local_ids[self._arcs]
+        mask = (arcs >= 0).all(axis=1)
+        return arcs[mask, 0], arcs[mask, 1], self._weights[mask]
+
+    def reweighted(
+        self,
+        delta: float = DELTA,
+        eta: float = ETA,
+        calculate_distances: bool = True,
+        num_workers: Optional[int] = None,
+    ) -> "DualGraph":
+        """Graph with the same arcs and raw features, but new weights.
+
+        Adjacency and per-arc features are shared with this graph, only
+        weights (and distances, if requested) are derived again.
+        """
+        graph = copy.copy(self)
+        graph._delta = delta
+        graph._eta = eta
+        # Adjacency of this graph has the old weights
+        graph.__dict__.pop("graph", None)
+        graph._distance = []
+        graph._csr = []
+        graph._backend = None
+        graph._budget = None
+        if num_workers is not None:
+            graph._num_workers = num_workers
+
+        graph._calculate_weights()
+        if calculate_distances:
+            graph._calculate_distances()
+
+        return graph
 
     def _create_graph(self) -> None:
-        # Find adjacent faces - 2 common vertices
+        # Find adjacent faces - 2 common vertices, e.g. a common edge
         faces = self._mesh.faces
 
         logging.info(
             "Creating a dual graph, calculating angular and geodesic distances."
         )
-        for i, face_one in tqdm.tqdm(enumerate(faces), total=len(faces)):
-            for j, face_two in enumerate(faces):
-                if i == j:
-                    continue
-
-                # Check if they have 2 common vertices => common edge
-                vts_one = {
-                    face_one.vertex_one,
-                    face_one.vertex_two,
-                    face_two.vertex_three,
-                }
-                vts_two = {
-                    face_two.vertex_one,
-                    face_two.vertex_two,
-                    face_two.vertex_three,
-                }
-                common = list(vts_one.intersection(vts_two))
-                if len(common) == 2:
-                    # Define connections (weights calculated later)
-                    ang_distance = angular_distance(face_one, face_two)
-                    geod_distance = geodesic_distance(
-                        face_one=face_one,
-                        face_two=face_two,
-                        common_one=common[0],
-                        common_two=common[1],
-                    )
-                    self._ang_dists.append(ang_distance)
-                    self._geod_dists.append(geod_distance)
-                    # Add arcs
-                    self._graph[face_one][face_two] = GraphEdge(
-                        ang_distance=ang_distance,
-                        geod_distance=geod_distance,
-                        weight=None,
-                    )
-                    self._graph[face_two][face_one] = GraphEdge(
-                        ang_distance=ang_distance,
-                        geod_distance=geod_distance,
-                        weight=None,
-                    )
+        edge_faces: dict[frozenset[Vertex], list[int]] = defaultdict(list)
+        for idx, face in enumerate(faces):
+            for vtx_one, vtx_two in (
+                (face.vertex_one, face.vertex_two),
+                (face.vertex_two, face.vertex_three),
+                (face.vertex_three, face.vertex_one),
+            ):
+                edge_faces[frozenset((vtx_one, vtx_two))].append(idx)
+
+        arcs = set()
+        for edge, face_ids in edge_faces.items():
+            for i, idx_one in enumerate(face_ids):
+                for idx_two in face_ids[i + 1 :]:
+                    if idx_one != idx_two:
+                        arcs.add(
+                            (min(idx_one, idx_two), max(idx_one, idx_two))
+                        )
+
+        arcs = sorted(arcs)
+        ang_dists, convex, geod_dists = [], [], []
+        with stage(self._progress, "graph", total=len(arcs)):
+            for idx_one, idx_two in track(
+                self._progress, "graph", arcs, total=len(arcs)
+            ):
+                face_one, face_two = faces[idx_one], faces[idx_two]
+                common = list(
+                    set(face_one.vertices).intersection(face_two.vertices)
+                )
+                # Define connections (weights calculated later)
+                ang_distance, is_convex = angular_features(face_one, face_two)
+                geod_distance = geodesic_distance(
+                    face_one=face_one,
+                    face_two=face_two,
+                    common_one=common[0],
+                    common_two=common[1],
+                )
+                ang_dists.append(ang_distance)
+                convex.append(is_convex)
+                geod_dists.append(geod_distance)
+
+        self._arcs = np.array(arcs, dtype=np.int64).reshape(-1, 2)
+        self._ang_dists = np.array(ang_dists, dtype=np.float64)
+        self._convex = np.array(convex, dtype=bool)
+        self._geod_dists = np.array(geod_dists, dtype=np.float64)
         logging.info("Dual graph created")
 
+    def _label_components(self) -> None:
+        """Label connected components of the dual graph."""
+        num_faces = self._mesh.num_faces
+        self._face_ids = {
+            face: idx for idx, face in enumerate(self._mesh.faces)
+        }
+        neighbours: list[list[int]] = [[] for _ in range(num_faces)]
+        for idx_one, idx_two in self._arcs.tolist():
+            neighbours[idx_one].append(idx_two)
+            neighbours[idx_two].append(idx_one)
+
+        components = np.full(num_faces, -1, dtype=np.int64)
+        num_components = 0
+        for start in range(num_faces):
+            if components[start] >= 0:
+                continue
+
+            components[start] = num_components
+            stack = [start]
+            while stack:
+                for neighbour in neighbours[stack.pop()]:
+                    if components[neighbour] < 0:
+                        components[neighbour] = num_components
+                        stack.append(neighbour)
+            num_components += 1
+
+        self._components = components
+        self._component_faces = [
+            np.flatnonzero(components == idx) for idx in range(num_components)
+        ]
+        self._local_ids = np.empty(num_faces, dtype=np.int64)
+        for face_ids in self._component_faces:
+            self._local_ids[face_ids] = np.arange(len(face_ids))
+        # Arcs grouped by component, both ends share it
+        arc_components = components[self._arcs[:, 0]]
+        order = np.argsort(arc_components, kind="stable")
+        bounds = np.searchsorted(
+            arc_components[order], np.arange(1, num_components)
+        )
+        self._component_arc_ids = np.split(order, bounds)
+
+        num_entries = sum(len(ids) ** 2 for ids in self._component_faces)
+        logging.info(
+            f"Dual graph has {num_components} connected components,"
+            f" {num_entries} distance entries instead of {num_faces ** 2}"
+        )
+
     def _calculate_weights(self) -> None:
         logging.info("Calculating weights for dual graph arcs")
+        self._weights = arc_weights(
+            ang_dists=self._ang_dists,
+            convex=self._convex,
+            geod_dists=self._geod_dists,
+            delta=self._delta,
+            eta=self._eta,
+        )
+        logging.info("Dual graph weights were calculated")
 
-        # Calculate average
-        average_angular = sum(self._ang_dists) / len(self._ang_dists)
-        average_geod = sum(self._geod_dists) / len(self._geod_dists)
+    def _component_arcs(
+        self, component: int
+    ) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """Arcs of the component in its local face ids and their weights."""
+        arc_ids = self._component_arc_ids[component]
+        arcs = self._local_ids[self._arcs[arc_ids]]
+        return arcs[:, 0], arcs[:, 1], self._weights[arc_ids]
 
-        # Caclulate weights for arcs
-        for face_one in self._graph:
-            for face_two in self._graph[face_one]:
-                edge = self._graph[face_one][face_two]
-                if edge.weight is not None:
-                    continue
+    def _component_row(self, component: int, local_idx: int) -> np.ndarray:
+        return distance_rows(
+            self._csr[component],
+            np.array([local_idx]),
+            shortest_paths=self._shortest_paths,
+            n_smallest=self._dist_n_smallest,
+        )[0]
 
-                ang = (1 - DELTA) * edge.ang_distance / average_angular
-                geod = DELTA * edge.geod_distance / average_geod
-                edge.weight = ang + geod
-        logging.info("Dual graph weights were calculated")
+    def _fill_rows(self, component: int, sources: np.ndarray) -> None:
+        """Shortest paths from the sources into the component store."""
+        store = self._distance[component]
+        graph = self._csr[component]
+        if self._shortest_paths == ShortestPaths.scipy:
+            rows = scipy_dijkstra_rows(graph, sources)
+            for local_idx, row in zip(sources.tolist(), rows):
+                store.set_row(local_idx, row)
+        else:
+            # Rows of the store are written in place
+            for local_idx in sources.tolist():
+                dijkstra_row(
+                    graph,
+                    local_idx,
+                    n_smallest=self._dist_n_smallest,
+                    out=store.row(local_idx),
+                )
 
-    def _shortest_path_dijkstra(
-        self,
-        start: Face,
-    ) -> tuple[Face, dict[GraphEdge, float]]:
-        # Distances to nodes
-        distances = {node: float("infinity") for node in self.graph}
-        distances[start] = 0.0
-        unvisited = [HeapNode(distance=distances[start], face=start)]
-        heapq.heapify(unvisited)
-
-        while unvisited:
-            # The closest unvisited node, greedily look
-            curr_node = heapq.heappop(unvisited)
-            # Update distances of neighbors
-            for neighbor, edge in heapq.nsmallest(
-                n=self._dist_n_smallest,
-                iterable=self.graph[curr_node.face].items(),
-                key=lambda x: x[1],
-            ):
-                weight = edge.weight
-                if weight + curr_node.distance < distances[neighbor]:
-                    distances[neighbor] = weight + curr_node.distance
-                    heapq.heappush(
-                        unvisited,
-                        HeapNode(distance=distances[neighbor], face=neighbor),
-                    )
+    def _distances_key(self) -> str:
+        """Hash of everything the distances depend on."""
+        digest = hashlib.sha1()
+        digest.update(self._arcs.tobytes())
+        digest.update(self._weights.tobytes())
+        digest.update(
+            f"{self._mesh.num_faces};{self._dist_n_smallest}".encode()
+        )
+        return digest.hexdigest()
 
-        return start, distances
+    def cache_key(self) -> str:
+        """Hash of everything segmentations of this graph depend on."""
+        # Exact backends give the same distances
+        backend = self._backend
+        if backend in (DistanceBackend.memmap, DistanceBackend.lazy):
+            backend = DistanceBackend.dense
+        key = f"{self._distances_key()};{backend}"
+        if backend == DistanceBackend.approximate:
+            # Landmarks are chosen by the budget, their count sets the bounds
+            num_landmarks = [store.num_landmarks for store in self._distance]
+            key += f";{self._budget};{num_landmarks}"
+        return hashlib.sha1(key.encode()).hexdigest()
+
+    def _checkpointed_stores(self) -> list[CheckpointedDistances]:
+        directory = self._checkpoint_dir / self._distances_key()
+        directory.mkdir(parents=True, exist_ok=True)
+        with (directory / "meta.json").open("w") as meta_file:
+            json.dump(
+                {
+                    "delta": self._delta,
+                    "eta": self._eta,
+                    "dist_n_smallest": self._dist_n_smallest,
+                    "num_faces": self._mesh.num_faces,
+                    "component_sizes": [
+                        len(ids) for ids in self._component_faces
+                    ],
+                },
+                meta_file,
+            )
+
+        logging.info(f"Distances are checkpointed in {directory}")
+        return [
+            CheckpointedDistances(
+                directory / f"component_{component}.dist", size=len(ids)
+            )
+            for component, ids in enumerate(self._component_faces)
+        ]
+
+    def _checkpoint(self) -> None:
+        start = time.perf_counter()
+        for store in self._distance:
+            store.checkpoint()
+        self._rows_since_checkpoint = 0
+        self._checkpoint_seconds += time.perf_counter() - start
+
+    def _rows_done(self, component: int, sources: np.ndarray) -> None:
+        """Rows are in the store, checkpoint every checkpoint_rows rows."""
+        if self._checkpoint_dir is None:
+            return
+
+        self._distance[component].mark_done(sources)
+        self._rows_since_checkpoint += len(sources)
+        if self._rows_since_checkpoint >= self._checkpoint_rows:
+            self._checkpoint()
 
     def _calculate_distances(self):
-        logging.info("Calculating distances between faces")
+        logging.info(
+            f"Calculating distances between faces, {self._shortest_paths}"
+            " shortest paths"
+        )
+        self._csr = [
+            CsrGraph.from_arcs(len(ids), *self._component_arcs(component))
+            for component, ids in enumerate(self._component_faces)
+        ]
+        backend, budget = select_distance_backend(
+            component_sizes=[len(ids) for ids in self._component_faces],
+            num_arcs=self.num_arcs,
+            memory_budget=self._memory_budget,
+            directory=self._distances_dir,
+        )
+        if self._distance_backend is not None:
+            backend = self._distance_backend
+            logging.info(f"Distance backend {backend} was set explicitly")
+        self._backend = backend
+        self._budget = budget
 
-        with ThreadPoolExecutor(max_workers=self._num_workers) as executor:
-            results = tqdm.tqdm(
-                executor.map(self._shortest_path_dijkstra, self._mesh.faces),
-                total=self._mesh.num_faces,
+        dense = backend in (DistanceBackend.dense, DistanceBackend.memmap)
+        if self._checkpoint_dir is not None and not dense:
+            logging.warning(
+                f"Distances of the {backend} backend are not checkpointed,"
+                f" {self._checkpoint_dir} is ignored"
+            )
+
+        # Every component gets its own store, checkpointed ones replace
+        # the dense stores, so only rows missing on disk are computed
+        if dense and self._checkpoint_dir is not None:
+            self._distance = self._checkpointed_stores()
+            sources = [store.missing_rows for store in self._distance]
+        else:
+            self._distance = [
+                create_distance_store(
+                    backend=backend,
+                    size=len(ids),
+                    compute_row=partial(self._component_row, component),
+                    arcs=(
+                        self._component_arcs(component)
+                        if backend == DistanceBackend.heat
+                        else None
+                    ),
+                    budget=budget,
+                    num_faces=self._mesh.num_faces,
+                    directory=self._distances_dir,
+                )
+                for component, ids in enumerate(self._component_faces)
+            ]
+            sources = [np.arange(len(ids)) for ids in self._component_faces]
+        if not dense:
+            logging.info("Distances are computed on demand")
+            return
+
+        start = time.perf_counter()
+        self._rows_since_checkpoint = 0
+        self._checkpoint_seconds = 0.0
+        if self._sharded is not None:
+            self._sharded.fill(
+                graphs=self._csr,
+                stores=self._distance,
+                sources=sources,
+                shortest_paths=self._shortest_paths,
+                n_smallest=self._dist_n_smallest,
+                progress=self._progress,
+                on_rows=self._rows_done,
+            )
+        else:
+            self._fill_distances(sources)
+        if self._checkpoint_dir is not None:
+            self._checkpoint()
+            self._report_checkpoints(
+                num_computed=sum(len(ids) for ids in sources),
+                seconds=time.perf_counter() - start,
             )
-            for face, distances in results:
-                self._distance[face] = distances
 
         logging.info("Distances calulated")
+
+    def _fill_distances(self, sources: list[np.ndarray]) -> None:
+        # Batches of sources of all the components share the same pool
+        batches = [
+            (component, ids[start : start + DIJKSTRA_BATCH_SIZE])
+            for component, ids in enumerate(sources)
+            for start in range(0, len(ids), DIJKSTRA_BATCH_SIZE)
+        ]
+        with ThreadPoolExecutor(
+            max_workers=self._num_workers
+        ) as executor, stage(self._progress, "distances", total=len(batches)):
+            # Results come in order of the batches
+            for batch, _ in zip(
+                batches,
+                track(
+                    self._progress,
+                    "distances",
+                    executor.map(self._fill_rows, *zip(*batches)),
+                    total=len(batches),
+                ),
+            ):
+                self._rows_done(*batch)
+
+    def _report_checkpoints(self, num_computed: int, seconds: float) -> None:
+        num_rows = self._mesh.num_faces
+        num_resumed = num_rows - num_computed
+        logging.info(
+            f"Distances: {num_resumed}/{num_rows} rows resumed from the"
+            f" checkpoint, {num_computed} computed in {seconds:.2f}s,"
+            f" checkpoints took {self._checkpoint_seconds:.2f}s"
+            f" ({100 * self._checkpoint_seconds / max(seconds, 1e-9):.1f}%)"
+        )
+        if num_resumed and num_computed:
+            logging.info(
+                f"Resuming skipped {100 * num_resumed / num_rows:.1f}% of"
+                f" the rows, ~{num_rows / num_computed:.1f}x less"
+                " work than a full run"
+            )
+        if self._progress.enabled:
+            self._progress.metrics(
+                "distances",
+                resumed_rows=num_resumed,
+                checkpoint_seconds=self._checkpoint_seconds,
+            )
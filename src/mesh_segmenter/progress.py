@@ -0,0 +1,174 @@
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from typing import Iterable, Iterator, Optional, TypeVar
+
+T = TypeVar("T")
+
+PROGRESS_INTERVAL = 0.1  # Seconds between progress ticks
+
+
+class ProgressHook:
+    """Receives progress events of the pipeline stages.
+
+    Subclass and override the events of interest, all of them are no-ops
+    here. Progress ticks are throttled by `track`, so sinks may be slow.
+    """
+
+    # Disabled hooks are skipped entirely in hot loops
+    enabled = True
+
+    def stage_start(self, stage: str, total: Optional[int] = None) -> None:
+        """Stage started, total is the number of items if known."""
+
+    def progress(self, stage: str, done: int, total: Optional[int]) -> None:
+        """Number of items of the stage done so far."""
+
+    def metrics(self, stage: str, **values: float) -> None:
+        """Per-iteration metrics of iterative stages."""
+
+    def stage_end(self, stage: str, seconds: float) -> None:
+        """Stage finished after the given number of seconds."""
+
+
+class NoProgress(ProgressHook):
+    """Default hook, ignores everything at no cost."""
+
+    enabled = False
+
+
+NO_PROGRESS = NoProgress()
+
+
+class LoggingProgress(ProgressHook):
+    """Logs stages, metrics and progress not more often than interval."""
+
+    def __init__(self, interval: float = 5.0) -> None:
+        self._interval = interval
+        self._last_log = 0.0
+
+    def stage_start(self, stage: str, total: Optional[int] = None) -> None:
+        logging.info(f"Stage {stage} started")
+
+    def progress(self, stage: str, done: int, total: Optional[int]) -> None:
+        now = time.perf_counter()
+        if now - self._last_log >= self._interval:
+            self._last_log = now
+            logging.info(f"Stage {stage}: {done}/{total or '?'}")
+
+    def metrics(self, stage: str, **values: float) -> None:
+        logging.info(f"Stage {stage}: {values}")
+
+    def stage_end(self, stage: str, seconds: float) -> None:
+        logging.info(f"Stage {stage} finished in {seconds:.2f}s")
+
+
+class TqdmProgress(ProgressHook):
+    """Progress bars on stderr, one per running stage.
+
+    Components are segmented by parallel threads, each running the same
+    stages, so bars are kept per stage and thread.
+    """
+
+    def __init__(self) -> None:
+        try:
+            import tqdm
+        except ImportError as err:
+            raise ImportError(
+                "TqdmProgress needs tqdm, install it with pip install tqdm"
+            ) from err
+
+        self._tqdm = tqdm.tqdm
+        self._bars = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _key(stage: str) -> tuple[str, int]:
+        return stage, threading.get_ident()
+
+    def stage_start(self, stage: str, total: Optional[int] = None) -> None:
+        with self._lock:
+            self._bars[self._key(stage)] = self._tqdm(desc=stage, total=total)
+
+    def progress(self, stage: str, done: int, total: Optional[int]) -> None:
+        bar = self._bars.get(self._key(stage))
+        if bar is not None:
+            bar.update(done - bar.n)
+
+    def metrics(self, stage: str, **values: float) -> None:
+        bar = self._bars.get(self._key(stage))
+        if bar is not None:
+            bar.set_postfix(values)
+
+    def stage_end(self, stage: str, seconds: float) -> None:
+        with self._lock:
+            bar = self._bars.pop(self._key(stage), None)
+        if bar is not None:
+            bar.close()
+
+
+@contextmanager
+def stage(
+    hook: ProgressHook, name: str, total: Optional[int] = None
+) -> Iterator[None]:
+    """Report start and end of a stage."""
+    if not hook.enabled:
+        yield
+        return
+
+    start = time.perf_counter()
+    hook.stage_start(name, total)
+    try:
+        yield
+    finally:
+        hook.stage_end(name, time.perf_counter() - start)
+
+
+def track(
+    hook: ProgressHook,
+    name: str,
+    iterable: Iterable[T],
+    total: Optional[int] = None,
+    interval: float = PROGRESS_INTERVAL,
+) -> Iterable[T]:
+    """Iterate and report throttled progress ticks, as is if disabled."""
+    if not hook.enabled:
+        return iterable
+
+    return _track(hook, name, iterable, total, interval)
+
+
+def _track(
+    hook: ProgressHook,
+    name: str,
+    iterable: Iterable[T],
+    total: Optional[int],
+    interval: float,
+) -> Iterator[T]:
+    last_tick = time.perf_counter()
+    done = 0
+    for item in iterable:
+        yield item
+        done += 1
+        now = time.perf_counter()
+        if now - last_tick >= interval:
+            last_tick = now
+            hook.progress(name, done, total)
+
+    hook.progress(name, done, total)
+
+
+def progress_hook(name: str) -> ProgressHook:
+    """Progress hook by name: tqdm, log or none."""
+    if name == "tqdm":
+        try:
+            return TqdmProgress()
+        except ImportError:
+            logging.warning("tqdm is not installed, logging progress instead")
+            return LoggingProgress()
+
+    if name == "log":
+        return LoggingProgress()
+
+    return NO_PROGRESS
@@ -0,0 +1,268 @@
+import hashlib
+import json
+import logging
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Iterator, Optional
+
+import numpy as np
+
+from mesh_segmenter.segmenters import SegmentationTree
+from mesh_segmenter.utils.colour import Colour
+from mesh_segmenter.utils.constants import (
+    COLOUR_BLUE,
+    COLOUR_GREEN,
+    COLOUR_RED,
+    COLOUR_WHITE,
+    WELD_TOLERANCE,
+)
+from mesh_segmenter.utils.mesh import Mesh
+from mesh_segmenter.utils.utils import (
+    FORMAT,
+    HEADER_END,
+    HEADER_START,
+    parse_ply,
+)
+
+RESULT_VERSION = 2
+COLOUR_PROPERTIES = ("red", "green", "blue")
+HASH_CHUNK_SIZE = 1024 * 1024
+
+
+def file_hash(path: Path) -> str:
+    """sha1 of the file bytes."""
+    digest = hashlib.sha1()
+    with path.open("rb") as input_file:
+        while chunk := input_file.read(HASH_CHUNK_SIZE):
+            digest.update(chunk)
+
+    return digest.hexdigest()
+
+
+@dataclass
+class SegmentationResult:
+    """Segmentation of a mesh without the mesh itself.
+
+    Arrays are per face of the parsed mesh, source_face_map gives the
+    parsed face of every face of the source file, -1 if dropped.
+    """
+
+    # Node of every face at every level, the last level are the labels
+    hierarchy: np.ndarray
+    # Memberships of every face in both halves of its parent node
+    probs: np.ndarray
+    source_face_map: np.ndarray
+    mesh_hash: str
+    source_hash: Optional[str] = None
+    parameters: dict = field(default_factory=dict)
+
+    @property
+    def labels(self) -> np.ndarray:
+        return self.hierarchy[-1]
+
+    @property
+    def num_levels(self) -> int:
+        return len(self.hierarchy)
+
+    @classmethod
+    def from_tree(
+        cls,
+        tree: SegmentationTree,
+        mesh: Mesh,
+        source_path: Optional[Path] = None,
+        parameters: Optional[dict] = None,
+    ) -> "SegmentationResult":
+        source_face_map = mesh.source_face_map
+        if source_face_map is None:
+            source_face_map = np.arange(mesh.num_faces)
+        return cls(
+            hierarchy=tree.labels,
+            probs=tree.probs,
+            source_face_map=np.asarray(source_face_map, dtype=np.int64),
+            mesh_hash=mesh.content_hash(),
+            source_hash=(
+                file_hash(source_path) if source_path is not None else None
+            ),
+            parameters=parameters or {},
+        )
+
+    def to_tree(self) -> SegmentationTree:
+        return SegmentationTree(labels=self.hierarchy, probs=self.probs)
+
+    def save(self, path: Path) -> None:
+        """Write the result as a compressed .npz file."""
+        with path.open("wb") as out_file:
+            np.savez_compressed(
+                out_file,
+                version=RESULT_VERSION,
+                hierarchy=self.hierarchy.astype(np.int32),
+                probs=self.probs.astype(np.float32),
+                source_face_map=self.source_face_map.astype(np.int64),
+                mesh_hash=self.mesh_hash,
+                source_hash=self.source_hash or "",
+                parameters=json.dumps(self.parameters),
+            )
+
+
+def load_result(path: Path) -> SegmentationResult:
+    """Read a result written by SegmentationResult.save."""
+    with np.load(path) as data:
+        version = int(data["version"])
+        if version != RESULT_VERSION:
+            raise ValueError(
+                f"Unsupported result version {version} of {path},"
+                f" expected {RESULT_VERSION}"
+            )
+
+        return SegmentationResult(
+            hierarchy=data["hierarchy"].astype(np.int64),
+            probs=data["probs"].astype(np.float64),
+            source_face_map=data["source_face_map"],
+            mesh_hash=str(data["mesh_hash"]),
+            source_hash=str(data["source_hash"]) or None,
+            parameters=json.loads(str(data["parameters"])),
+        )
+
+
+def label_colours(num_labels: int) -> list[Colour]:
+    """The same colour for the same label in every run."""
+    colours = [COLOUR_RED, COLOUR_BLUE, COLOUR_GREEN]
+    rng = np.random.default_rng(0)
+    while len(colours) < num_labels:
+        colours.append(Colour(*rng.integers(0, 256, size=3).tolist()))
+
+    return colours[:num_labels]
+
+
+def apply_result(
+    result: SegmentationResult,
+    ply_path: Path,
+    out_path: Path,
+    check_source: bool = True,
+) -> None:
+    """Paint the labels onto the source .ply, one line at a time.
+
+    Everything but face colours is copied as is, missing colour properties
+    are added to the faces. Duplicate faces get the colour of their twin,
+    degenerate faces dropped when the mesh was parsed are white. The
+    source file is checked against the hash of the result, its parsed
+    mesh if the source was not hashed, unless check_source is False.
+    """
+    if check_source:
+        _check_source(result, ply_path)
+
+    with ply_path.open("r") as input_file, out_path.open("w") as out_file:
+        header = []
+        for line in input_file:
+            header.append(line)
+            if line.strip() == HEADER_END:
+                break
+        else:
+            raise ValueError("Invalid ply, no end of the header")
+        if header[0].strip() != HEADER_START or header[1].strip() != FORMAT:
+            raise ValueError("Only ascii ply files are supported")
+
+        # Elements in file order with their properties
+        elements: list[tuple[str, int, list[tuple[str, bool]]]] = []
+        for line in header:
+            words = line.split()
+            if words[:1] == ["element"]:
+                elements.append((words[1], int(words[2]), []))
+            elif words[:1] == ["property"] and elements:
+                elements[-1][2].append((words[-1], words[1] == "list"))
+
+        face_properties = [
+            properties for name, _, properties in elements if name == "face"
+        ]
+        if not face_properties:
+            raise ValueError("Invalid ply, no faces")
+        property_names = [name for name, _ in face_properties[0]]
+        missing = [
+            name for name in COLOUR_PROPERTIES if name not in property_names
+        ]
+
+        in_faces = False
+        for line in header:
+            words = line.split()
+            ends_faces = in_faces and (
+                words[:1] == ["element"] or line.strip() == HEADER_END
+            )
+            if ends_faces:
+                out_file.writelines(
+                    f"property uint8 {name}\n" for name in missing
+                )
+            if words[:1] == ["element"]:
+                in_faces = words[1] == "face"
+            out_file.write(line)
+
+        for name, count, properties in elements:
+            if name != "face":
+                for _ in range(count):
+                    out_file.write(input_file.readline())
+                continue
+
+            for colour in _face_colours(result, num_faces=count):
+                values = input_file.readline().split()
+                positions = {}
+                pos = 0
+                for property_name, is_list in properties:
+                    if is_list:
+                        pos += int(values[pos]) + 1
+                    else:
+                        positions[property_name] = pos
+                        pos += 1
+                # Existing colour values are replaced, missing ones added
+                for property_name, value in zip(COLOUR_PROPERTIES, colour):
+                    if property_name in positions:
+                        values[positions[property_name]] = value
+                values.extend(
+                    value
+                    for property_name, value in zip(COLOUR_PROPERTIES, colour)
+                    if property_name in missing
+                )
+                out_file.write(" ".join(values) + "\n")
+
+    logging.info(f"Labels of {result.labels.size} faces applied to {out_path}")
+
+
+def _check_source(result: SegmentationResult, ply_path: Path) -> None:
+    """Source file, or its parsed mesh, is the one of the result."""
+    if result.source_hash is not None:
+        # Same bytes parse into the same mesh
+        if file_hash(ply_path) != result.source_hash:
+            raise ValueError(
+                f"{ply_path} is not the mesh the result was computed for"
+            )
+        return
+
+    # Parsing with the same cleanup gives the segmented faces
+    mesh = parse_ply(
+        ply_path=ply_path,
+        weld_tolerance=result.parameters.get("weld_tolerance", WELD_TOLERANCE),
+    )
+    if mesh.content_hash() != result.mesh_hash:
+        raise ValueError(
+            f"Parsed {ply_path} differs from the mesh the result was"
+            " computed for"
+        )
+
+
+def _face_colours(
+    result: SegmentationResult, num_faces: int
+) -> Iterator[list[str]]:
+    """Colour values of every face of the source file, one at a time."""
+    source_face_map = result.source_face_map
+    if len(source_face_map) != num_faces:
+        raise ValueError(
+            f"Result has {len(source_face_map)} source faces, the file has"
+            f" {num_faces}"
+        )
+
+    labels = np.where(source_face_map >= 0, result.labels[source_face_map], -1)
+    colours = [
+        str(colour).split()
+        for colour in label_colours(int(labels.max(initial=-1)) + 1)
+    ]
+    unlabelled = str(COLOUR_WHITE).split()
+    for label in labels:
+        yield colours[label] if label >= 0 else unlabelled
@@ -1,25 +1,106 @@
 import argparse
+from functools import partial
 import multiprocessing
+import os
 from pathlib import Path
 import logging
 
-from mesh_segmenter.utils.constants import SegmenterType
+from mesh_segmenter.utils.constants import (
+    SegmenterType,
+    DistanceBackend,
+    ShortestPaths,
+    CHECKPOINT_ROWS,
+    DIST_N_SMALLEST,
+    WELD_TOLERANCE,
+    WORKER_TIMEOUT,
+    DELTA,
+    ETA,
+)
+from mesh_segmenter.cache import NodeCache
+from mesh_segmenter.distances import parse_memory_size
+from mesh_segmenter.progress import progress_hook
 from mesh_segmenter.utils.utils import parse_ply, write_ply
 from mesh_segmenter.graph import DualGraph
-from mesh_segmenter.segmenters import BinaryRecursive, BinarySegmenter
+from mesh_segmenter.segmenters import (
+    BinaryRecursive,
+    BinarySegmenter,
+    SpectralSegmenter,
+)
+from mesh_segmenter.sweep import run_sweep, format_sweep_table
+from mesh_segmenter.results import (
+    SegmentationResult,
+    apply_result,
+    load_result,
+)
+from mesh_segmenter.server import serve
+from mesh_segmenter.sharding import (
+    ShardedDistances,
+    parse_address,
+    run_worker,
+)
 
+AUTHKEY_ENV = "MESH_SEGMENTER_AUTHKEY"
 
-def _parse_args() -> argparse.Namespace:
-    parser = argparse.ArgumentParser(
-        formatter_class=argparse.ArgumentDefaultsHelpFormatter
-    )
+
+def _add_common_args(
+    parser: argparse.ArgumentParser, input_required: bool = True
+) -> None:
     parser.add_argument(
         "-i",
         "--input_file",
         type=Path,
-        required=True,
+        required=input_required,
         help="Input .ply file path",
     )
+    parser.add_argument(
+        "-k",
+        "--num_levels",
+        type=int,
+        default=1,
+        help="Number of segmentation levels for the binary segmenter.",
+    )
+    parser.add_argument(
+        "-t",
+        "--num_threads",
+        type=int,
+        default=multiprocessing.cpu_count(),
+    )
+    parser.add_argument(
+        "-l",
+        "--log_level",
+        default="INFO",
+        choices=["INFO", "WARNING", "ERROR"],
+        help="Logging level",
+    )
+    parser.add_argument(
+        "-m",
+        "--memory_budget",
+        "--memory-budget",
+        type=parse_memory_size,
+        default=None,
+        help="RAM for distances, e.g. 512M or 4G, available RAM if not set",
+    )
+    parser.add_argument(
+        "--distance_backend",
+        type=DistanceBackend,
+        default=None,
+        choices=list(DistanceBackend),
+        help="Force a distance backend instead of choosing by memory budget",
+    )
+    parser.add_argument(
+        "--weld_tolerance",
+        type=float,
+        default=WELD_TOLERANCE,
+        help="Weld vertices closer than this share of the bounding box"
+        " diagonal, 0 welds exact duplicates only",
+    )
+
+
+def _parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter
+    )
+    _add_common_args(parser, input_required=False)
     parser.add_argument(
         "-o",
         "--output_file",
@@ -27,27 +108,223 @@ def _parse_args() -> argparse.Namespace:
         default=Path("output_decompose.ply"),
         help="Output .ply filename",
     )
+    parser.add_argument(
+        "-r",
+        "--result_file",
+        type=Path,
+        default=None,
+        help="Also write labels, memberships and the hierarchy into a .npz"
+        " file, see the apply command",
+    )
+    parser.add_argument(
+        "-p",
+        "--progress",
+        default="tqdm",
+        choices=["tqdm", "log", "none"],
+        help="How to report progress of the stages",
+    )
     parser.add_argument(
         "-s",
         "--segmenter",
-        type=str,
+        type=SegmenterType,
         default=SegmenterType.binary,
         choices=list(SegmenterType),
     )
     parser.add_argument(
-        "-k",
-        "--num_levels",
+        "--active_set",
+        action="store_true",
+        help="Freeze settled faces and only re-evaluate the fuzzy band and"
+        " representative candidates in clustering iterations",
+    )
+    parser.add_argument(
+        "--warm_start",
+        action="store_true",
+        help="Spectral segmenter only: start fuzzy iterations from the"
+        " Fiedler vector instead of using it as memberships directly",
+    )
+    parser.add_argument(
+        "--shortest_paths",
+        type=ShortestPaths,
+        default=None,
+        choices=list(ShortestPaths),
+        help="Shortest paths implementation, scipy if installed",
+    )
+    parser.add_argument(
+        "--dist_n_smallest",
         type=int,
-        default=1,
-        help="Number of segmentation levels for the binary segmenter.",
+        default=None,
+        help="Relax only the n nearest neighbours of every face, faster but"
+        f" approximate distances, e.g. {DIST_N_SMALLEST}. Heap shortest"
+        " paths only",
+    )
+    parser.add_argument(
+        "--node_cache_dir",
+        type=Path,
+        default=None,
+        help="Cache memberships of the segmentation tree nodes there, runs"
+        " with more levels only compute the new ones",
+    )
+    parser.add_argument(
+        "--checkpoint_dir",
+        type=Path,
+        default=None,
+        help="Keep all-pairs distances there, a killed run started again"
+        " with the same mesh and parameters computes only the missing rows",
+    )
+    parser.add_argument(
+        "--checkpoint_rows",
+        type=int,
+        default=CHECKPOINT_ROWS,
+        help="Distance rows computed between checkpoints",
+    )
+    parser.add_argument(
+        "--distance_workers",
+        type=int,
+        default=0,
+        help="Compute distances in this many local worker processes",
+    )
+    parser.add_argument(
+        "--listen",
+        type=str,
+        default=None,
+        help="Also accept remote distance workers on host:port, they are"
+        " started with segment_mesh worker",
+    )
+    parser.add_argument(
+        "--authkey",
+        type=str,
+        default=os.environ.get(AUTHKEY_ENV),
+        help=f"Shared secret of distance workers, ${AUTHKEY_ENV} if not set",
     )
     parser.add_argument(
+        "--worker_timeout",
+        type=float,
+        default=WORKER_TIMEOUT,
+        help="Seconds without distance workers before failing, and without"
+        " an answer before a busy worker's shard is reassigned",
+    )
+
+    subparsers = parser.add_subparsers(dest="command")
+    sweep_parser = subparsers.add_parser(
+        "sweep",
+        help="Segment with every DELTA/ETA/prob_threshold combination.",
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter,
+    )
+    _add_common_args(sweep_parser)
+    sweep_parser.add_argument(
+        "--deltas", type=float, nargs="+", default=[DELTA]
+    )
+    sweep_parser.add_argument("--etas", type=float, nargs="+", default=[ETA])
+    sweep_parser.add_argument(
+        "--prob_thresholds", type=float, nargs="+", default=[0.5]
+    )
+    sweep_parser.add_argument(
+        "--output_dir",
+        type=Path,
+        default=None,
+        help="If set, write a .ply for every setting into the directory",
+    )
+    serve_parser = subparsers.add_parser(
+        "serve",
+        help="Run a local segmentation server with warm workers.",
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter,
+    )
+    serve_parser.add_argument("--host", type=str, default="127.0.0.1")
+    serve_parser.add_argument("--port", type=int, default=8765)
+    serve_parser.add_argument(
+        "--unix_socket",
+        type=Path,
+        default=None,
+        help="Listen on a unix socket instead of the host and port",
+    )
+    serve_parser.add_argument(
+        "-w",
+        "--num_workers",
+        type=int,
+        default=multiprocessing.cpu_count(),
+        help="Number of worker processes",
+    )
+    serve_parser.add_argument(
         "-t",
         "--num_threads",
         type=int,
-        default=multiprocessing.cpu_count(),
+        default=1,
+        help="Number of threads per job",
     )
-    parser.add_argument(
+    serve_parser.add_argument(
+        "--queue_size",
+        type=int,
+        default=16,
+        help="Maximum number of queued jobs, further jobs are rejected",
+    )
+    serve_parser.add_argument(
+        "--cache_size",
+        type=int,
+        default=4,
+        help="Number of dual graphs cached by every worker",
+    )
+    serve_parser.add_argument(
+        "-m",
+        "--memory_budget",
+        type=parse_memory_size,
+        default=None,
+        help="RAM for distances of all cached graphs, available RAM if not"
+        " set",
+    )
+    serve_parser.add_argument(
+        "-l",
+        "--log_level",
+        default="INFO",
+        choices=["INFO", "WARNING", "ERROR"],
+        help="Logging level",
+    )
+    worker_parser = subparsers.add_parser(
+        "worker",
+        help="Compute distance shards for a segment_mesh --listen run.",
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter,
+    )
+    worker_parser.add_argument(
+        "address", type=str, help="host:port of the coordinator"
+    )
+    worker_parser.add_argument(
+        "--authkey",
+        type=str,
+        default=os.environ.get(AUTHKEY_ENV),
+        help=f"Shared secret of the coordinator, ${AUTHKEY_ENV} if not set",
+    )
+    worker_parser.add_argument(
+        "-l",
+        "--log_level",
+        default="INFO",
+        choices=["INFO", "WARNING", "ERROR"],
+        help="Logging level",
+    )
+    apply_parser = subparsers.add_parser(
+        "apply",
+        help="Paint labels of a --result_file onto the source .ply.",
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter,
+    )
+    apply_parser.add_argument("result_file", type=Path)
+    apply_parser.add_argument(
+        "-i",
+        "--input_file",
+        type=Path,
+        required=True,
+        help="Source .ply file of the result",
+    )
+    apply_parser.add_argument(
+        "-o",
+        "--output_file",
+        type=Path,
+        default=Path("output_decompose.ply"),
+        help="Output .ply filename",
+    )
+    apply_parser.add_argument(
+        "--force",
+        action="store_true",
+        help="Apply even if the source file differs from the segmented one",
+    )
+    apply_parser.add_argument(
         "-l",
         "--log_level",
         default="INFO",
@@ -55,34 +332,182 @@ def _parse_args() -> argparse.Namespace:
         help="Logging level",
     )
     # TODO: add some validation fof arguments
-    return parser.parse_args()
+    args = parser.parse_args()
+    if args.command is None and args.input_file is None:
+        parser.error("the following arguments are required: -i/--input_file")
+    # Workers unpickle what they receive, never accept them without a secret
+    if (args.command == "worker" or args.listen) and not args.authkey:
+        parser.error(
+            f"remote distance workers need --authkey or ${AUTHKEY_ENV}"
+        )
+
+    lazy_backends = (
+        DistanceBackend.lazy,
+        DistanceBackend.approximate,
+        DistanceBackend.heat,
+    )
+    if (
+        args.command is None
+        and args.checkpoint_dir is not None
+        and args.distance_backend in lazy_backends
+    ):
+        parser.error(
+            f"--checkpoint_dir needs all-pairs distances, the"
+            f" {args.distance_backend} backend computes them on demand"
+        )
+
+    return args
+
+
+def _sweep(args: argparse.Namespace) -> None:
+    mesh = parse_ply(
+        ply_path=args.input_file, weld_tolerance=args.weld_tolerance
+    )
+    results = run_sweep(
+        mesh=mesh,
+        deltas=args.deltas,
+        etas=args.etas,
+        prob_thresholds=args.prob_thresholds,
+        num_levels=args.num_levels,
+        num_workers=args.num_threads,
+        memory_budget=args.memory_budget,
+        distance_backend=args.distance_backend,
+    )
+    print(format_sweep_table(results))
+
+    if args.output_dir is not None:
+        args.output_dir.mkdir(parents=True, exist_ok=True)
+        for result in results:
+            setting = result.setting
+            write_ply(
+                mesh=result.mesh,
+                out_path=args.output_dir
+                / (
+                    f"sweep_d{setting.delta}_e{setting.eta}"
+                    f"_p{setting.prob_threshold}.ply"
+                ),
+            )
 
 
 def main():
     args = _parse_args()
     logging.basicConfig(level=logging.getLevelName(args.log_level))
 
+    if args.command == "sweep":
+        _sweep(args)
+        return
+
+    if args.command == "serve":
+        serve(
+            host=args.host,
+            port=args.port,
+            unix_socket=args.unix_socket,
+            num_workers=args.num_workers,
+            num_threads=args.num_threads,
+            queue_size=args.queue_size,
+            cache_size=args.cache_size,
+            memory_budget=args.memory_budget,
+        )
+        return
+
+    if args.command == "apply":
+        apply_result(
+            result=load_result(args.result_file),
+            ply_path=args.input_file,
+            out_path=args.output_file,
+            check_source=not args.force,
+        )
+        return
+
+    if args.command == "worker":
+        run_worker(
+            address=parse_address(args.address),
+            authkey=args.authkey.encode(),
+        )
+        return
+
+    sharded = None
+    if args.distance_workers or args.listen:
+        sharded = ShardedDistances(
+            address=parse_address(args.listen or "127.0.0.1:0"),
+            authkey=args.authkey.encode() if args.authkey else None,
+            num_local_workers=args.distance_workers,
+            worker_timeout=args.worker_timeout,
+        )
+
     # Parse ply file, form Mesh
-    mesh = parse_ply(ply_path=args.input_file)
-    dual_graph = DualGraph(mesh)
+    progress = progress_hook(args.progress)
+    mesh = parse_ply(
+        ply_path=args.input_file, weld_tolerance=args.weld_tolerance
+    )
+    # Spectral memberships need arc weights only, no distances
+    dual_graph = DualGraph(
+        mesh,
+        num_workers=args.num_threads,
+        progress=progress,
+        memory_budget=args.memory_budget,
+        distance_backend=args.distance_backend,
+        dist_n_smallest=args.dist_n_smallest,
+        shortest_paths=args.shortest_paths,
+        sharded=sharded,
+        checkpoint_dir=args.checkpoint_dir,
+        checkpoint_rows=args.checkpoint_rows,
+        calculate_distances=(
+            args.segmenter != SegmenterType.spectral or args.warm_start
+        ),
+    )
 
     # Choose segmenter
     if args.segmenter == SegmenterType.binary:
-        if args.num_levels == 1:
-            # Binary
-            segmenter = BinarySegmenter(num_workers=args.num_threads)
-        else:
-            # Binary recursive
-            segmenter = BinaryRecursive(
-                num_levels=args.num_levels,
-                num_workers=args.num_threads,
-            )
+        segmenter_cls = partial(BinarySegmenter, active_set=args.active_set)
+    elif args.segmenter == SegmenterType.spectral:
+        segmenter_cls = partial(
+            SpectralSegmenter,
+            warm_start=args.warm_start,
+            active_set=args.active_set,
+        )
 
-    # Segment
-    out_mesh = segmenter(mesh=mesh, dual_graph=dual_graph)
+    # Segment, a single level too, so the node cache keeps its root
+    segmenter = BinaryRecursive(
+        num_levels=args.num_levels,
+        num_workers=args.num_threads,
+        progress=progress,
+        segmenter_cls=segmenter_cls,
+        node_cache=(
+            NodeCache(args.node_cache_dir)
+            if args.node_cache_dir is not None
+            else None
+        ),
+    )
+    tree = segmenter.segment(mesh=mesh, dual_graph=dual_graph)
+    if args.num_levels == 1:
+        # Binary, in the colours of the binary segmenter
+        probs = dict(zip(mesh.faces, tree.probs[0].tolist()))
+        out_mesh = segmenter_cls(
+            num_workers=args.num_threads, progress=progress
+        ).colour_segments(mesh=mesh, probs=probs)
+    else:
+        # Binary recursive
+        out_mesh = segmenter.colour_tree(mesh=mesh, tree=tree)
 
     # Output results
     write_ply(mesh=out_mesh, out_path=args.output_file)
+    if args.result_file is not None:
+        SegmentationResult.from_tree(
+            tree=tree,
+            mesh=mesh,
+            source_path=args.input_file,
+            parameters={
+                "segmenter": str(args.segmenter),
+                "num_levels": args.num_levels,
+                "delta": dual_graph.delta,
+                "eta": dual_graph.eta,
+                "weld_tolerance": args.weld_tolerance,
+                "active_set": args.active_set,
+                "warm_start": args.warm_start,
+                "dist_n_smallest": args.dist_n_smallest,
+            },
+        ).save(args.result_file)
 
 
 if __name__ == "__main__":
@@ -1,2 +1,6 @@
 from mesh_segmenter.segmenters.binary import BinarySegmenter
-from mesh_segmenter.segmenters.binary_recursive import BinaryRecursive
+from mesh_segmenter.segmenters.binary_recursive import (
+    BinaryRecursive,
+    SegmentationTree,
+)
+from mesh_segmenter.segmenters.spectral import SpectralSegmenter
@@ -1,15 +1,22 @@
 import logging
-from copy import deepcopy
+import time
+from copy import copy, deepcopy
 import multiprocessing
 from functools import partial
 from concurrent.futures import ThreadPoolExecutor
 
-import tqdm
+import numpy as np
 
 from mesh_segmenter.graph import DualGraph
+from mesh_segmenter.progress import NO_PROGRESS, ProgressHook, stage, track
 from mesh_segmenter.utils.mesh import Mesh, Face
 from mesh_segmenter.utils.constants import (
     MAX_NUM_ITERS,
+    ACTIVE_TOL,
+    CANDIDATE_FRACTION,
+    FUZZY_BAND,
+    MIN_CANDIDATES,
+    OBJECTIVE_TOL,
     COLOUR_BLUE,
     COLOUR_RED,
 )
@@ -25,26 +32,50 @@ class BinarySegmenter:
         num_iters: int = MAX_NUM_ITERS,
         prob_threshold: float = 0.5,
         cluster_colors: tuple[Colour, Colour] = (COLOUR_BLUE, COLOUR_RED),
+        progress: ProgressHook = NO_PROGRESS,
+        active_set: bool = False,
+        active_tol: float = ACTIVE_TOL,
+        objective_tol: float = OBJECTIVE_TOL,
     ):
         self._num_workers = num_workers
+        self._progress = progress
+        # Active-set iterations, see _form_clusters_active
+        self._active_set = active_set
+        self._active_tol = active_tol
+        self._objective_tol = objective_tol
         self._num_iters = num_iters
         self._cluster_colors = cluster_colors
         self._color_unsure = sum(cluster_colors)
         self._prob_threshold = prob_threshold
 
+    def cache_params(self) -> dict:
+        """Settings the memberships depend on, for caches of them.
+
+        Subclasses with their own settings extend it, workers, threshold
+        and colours only affect speed and colouring.
+        """
+        return {
+            "num_iters": self._num_iters,
+            "active_set": self._active_set,
+            "active_tol": self._active_tol,
+            "objective_tol": self._objective_tol,
+        }
+
     def _init_reprs(self, mesh: Mesh, dual_graph: DualGraph) -> list[Face]:
         # For binary case
         # Choose a pair of nodes with highest distances
+        face_ids = dual_graph.face_ids(mesh.faces)
         max_dist = 0
         repr = [mesh.faces[0], mesh.faces[0]]
 
-        for i, face_one in enumerate(mesh.faces):
-            for j in range(i + 1, mesh.num_faces):
-                if (
-                    dist := dual_graph.get_distance(face_one, mesh.faces[j])
-                ) > max_dist:
-                    max_dist = dist
-                    repr = [face_one, mesh.faces[j]]
+        for i, face_one in enumerate(mesh.faces[:-1]):
+            distances = dual_graph.distances_from(
+                face_ids[i], face_ids[i + 1 :]
+            )
+            j = int(np.argmax(distances))
+            if distances[j] > max_dist:
+                max_dist = distances[j]
+                repr = [face_one, mesh.faces[i + 1 + j]]
 
         return repr
 
@@ -60,15 +91,17 @@ class BinarySegmenter:
         def calculate_probs(face: Face) -> tuple[Face, list[float]]:
             # If distance is closer to other repr - probability of beloning lower
             # Update and normalize
-            prob_zero = dual_graph.get_distance(face, reprs[1])
+            # Distances are read from the representatives rows, so lazy
+            # distance backends only need 2 rows
+            prob_zero = dual_graph.get_distance(reprs[1], face)
             prob_zero /= dual_graph.get_distance(
-                face, reprs[0]
-            ) + dual_graph.get_distance(face, reprs[1])
+                reprs[0], face
+            ) + dual_graph.get_distance(reprs[1], face)
 
-            prob_one = dual_graph.get_distance(face, reprs[0])
+            prob_one = dual_graph.get_distance(reprs[0], face)
             prob_one /= dual_graph.get_distance(
-                face, reprs[0]
-            ) + dual_graph.get_distance(face, reprs[1])
+                reprs[0], face
+            ) + dual_graph.get_distance(reprs[1], face)
 
             return face, [prob_zero, prob_one]
 
@@ -90,7 +123,7 @@ class BinarySegmenter:
         out_sum = 0.0
         for face_cur in mesh.faces:
             out_sum += probs[face_cur][cluster_idx] * dual_graph.get_distance(
-                face_cur, face
+                face, face_cur
             )
 
         return out_sum
@@ -119,11 +152,19 @@ class BinarySegmenter:
             )
             return (face, pa_dist_sum, pb_dist_sum)
 
-        with ThreadPoolExecutor(max_workers=self._num_workers) as executor:
-            p_dist_sums = list(tqdm.tqdm(
-                executor.map(calculate_sums, mesh.faces),
-                total=mesh.num_faces,
-            ))
+        with ThreadPoolExecutor(
+            max_workers=self._num_workers
+        ) as executor, stage(
+            self._progress, "representatives", total=mesh.num_faces
+        ):
+            p_dist_sums = list(
+                track(
+                    self._progress,
+                    "representatives",
+                    executor.map(calculate_sums, mesh.faces),
+                    total=mesh.num_faces,
+                )
+            )
 
         min_prob_a_dist = float("inf")
         min_prob_b_dist = float("inf")
@@ -134,15 +175,161 @@ class BinarySegmenter:
                 reprs = [face, reprs[1]]
 
             if pb_dist_sum < min_prob_b_dist:
-                min_prob_b_dist = min_prob_b_dist
+                min_prob_b_dist = pb_dist_sum
                 reprs = [reprs[0], face]
 
         return reprs
 
+    def _dist_sums(
+        self,
+        candidates: np.ndarray,
+        face_ids: np.ndarray,
+        probs: np.ndarray,
+        dual_graph: DualGraph,
+    ) -> np.ndarray:
+        """Membership weighted distance sums of candidates, per cluster."""
+
+        def calculate_sums(candidate: int) -> np.ndarray:
+            distances = dual_graph.distances_from(
+                face_ids[candidate], face_ids
+            )
+            with np.errstate(invalid="ignore"):
+                return np.nansum(probs * distances[:, None], axis=0)
+
+        with ThreadPoolExecutor(
+            max_workers=self._num_workers
+        ) as executor, stage(
+            self._progress, "representatives", total=len(candidates)
+        ):
+            sums = list(
+                track(
+                    self._progress,
+                    "representatives",
+                    executor.map(calculate_sums, candidates),
+                    total=len(candidates),
+                )
+            )
+
+        return np.array(sums).reshape(-1, 2)
+
+    def _form_clusters_active(
+        self, mesh: Mesh, dual_graph: DualGraph
+    ) -> dict[Face, list[float]]:
+        """Form clusters, re-evaluating only faces that still change.
+
+        Faces whose membership changed less than active_tol are frozen,
+        unless they are in the fuzzy band around 0.5. Representatives are
+        searched among the best candidates of the previous iteration only.
+        Iterations stop when representatives are stable or the objective
+        sum_f P_a(f) d(a, f) + P_b(f) d(b, f) stops decreasing.
+        """
+        face_ids = dual_graph.face_ids(mesh.faces)
+        num_faces = len(face_ids)
+
+        logging.info("Forming initial coarse clusters.")
+        positions = {face: idx for idx, face in enumerate(mesh.faces)}
+        reprs = tuple(
+            positions[face]
+            for face in self._init_reprs(mesh=mesh, dual_graph=dual_graph)
+        )
+        logging.info("Initial clusters were formed.")
+
+        probs = np.zeros((num_faces, 2))
+        active = np.ones(num_faces, dtype=bool)
+        candidates = np.arange(num_faces)
+        num_candidates = min(
+            num_faces, max(MIN_CANDIDATES, int(CANDIDATE_FRACTION * num_faces))
+        )
+        objective = np.inf
+        with stage(self._progress, "clustering", total=self._num_iters):
+            for iteration in range(self._num_iters):
+                start = time.perf_counter()
+                dist_a = dual_graph.distances_from(
+                    face_ids[reprs[0]], face_ids
+                )
+                dist_b = dual_graph.distances_from(
+                    face_ids[reprs[1]], face_ids
+                )
+
+                # Closer to the other representative - lower probability
+                num_active = int(active.sum())
+                with np.errstate(invalid="ignore", divide="ignore"):
+                    total = dist_a[active] + dist_b[active]
+                    new_probs = np.stack(
+                        [dist_b[active] / total, dist_a[active] / total],
+                        axis=1,
+                    )
+                new_probs = np.nan_to_num(new_probs, nan=0.5)
+                change = np.abs(new_probs - probs[active]).max(axis=1)
+                probs[active] = new_probs
+                still_changing = np.zeros(num_faces, dtype=bool)
+                still_changing[active] = change >= self._active_tol
+                active = still_changing | (
+                    np.abs(probs[:, 0] - 0.5) < FUZZY_BAND
+                )
+
+                prev_objective = objective
+                with np.errstate(invalid="ignore"):
+                    objective = np.nansum(
+                        probs[:, 0] * dist_a + probs[:, 1] * dist_b
+                    )
+
+                sums = self._dist_sums(
+                    candidates=candidates,
+                    face_ids=face_ids,
+                    probs=probs,
+                    dual_graph=dual_graph,
+                )
+                prev_reprs = reprs
+                reprs = (
+                    int(candidates[np.argmin(sums[:, 0])]),
+                    int(candidates[np.argmin(sums[:, 1])]),
+                )
+                # The best candidates of both clusters stay candidates
+                best = min(num_candidates, len(candidates))
+                candidates = np.union1d(
+                    candidates[np.argsort(sums[:, 0])[:best]],
+                    candidates[np.argsort(sums[:, 1])[:best]],
+                )
+
+                logging.info(
+                    f"Iteration {iteration + 1}: {num_active} active faces,"
+                    f" {len(sums)} candidates, objective {objective:.6g}"
+                )
+                if self._progress.enabled:
+                    self._progress.progress("clustering", iteration + 1, None)
+                    self._progress.metrics(
+                        "clustering",
+                        iteration=iteration + 1,
+                        active=num_active,
+                        candidates=len(sums),
+                        objective=float(objective),
+                        seconds=time.perf_counter() - start,
+                    )
+                if reprs == prev_reprs:
+                    break
+
+                if np.isfinite(prev_objective) and (
+                    prev_objective - objective
+                    <= self._objective_tol * abs(prev_objective)
+                ):
+                    break
+
+        logging.info(
+            "Fuzzy segmentation memberships updated, get fuzzy decompose."
+        )
+        return {
+            face: face_probs
+            for face, face_probs in zip(mesh.faces, probs.tolist())
+        }
+
     def _form_clusters(
         self, mesh: Mesh, dual_graph: DualGraph
     ) -> dict[Face, list[float]]:
         """Form segmentation clusters, output probabilities of memberships."""
+        if self._active_set:
+            return self._form_clusters_active(mesh=mesh, dual_graph=dual_graph)
+
         logging.info("Forming initial coarse clusters.")
         # Initial cluster centers, the 2 most further faces
         reprs: list[Face] = self._init_reprs(mesh=mesh, dual_graph=dual_graph)
@@ -152,23 +339,32 @@ class BinarySegmenter:
         logging.info("Iteratively update memberships, get fuzzy decompose.")
         probs = {face: [0.0, 0.0] for face in mesh.faces}
         # Iteratively update list of probabilities of belonging in clusters
-        for _ in tqdm.trange(self._num_iters):
-            cur_rep_a, cur_rep_b = reprs
-            self._update_probs(
-                reprs=reprs,
-                probs=probs,
-                mesh=mesh,
-                dual_graph=dual_graph,
-            )
-            reprs = self._update_reprs(
-                reprs=reprs,
-                probs=probs,
-                mesh=mesh,
-                dual_graph=dual_graph,
-            )
-            # If no updates
-            if cur_rep_a == reprs[0] and cur_rep_b == reprs[1]:
-                break
+        with stage(self._progress, "clustering", total=self._num_iters):
+            for iteration in range(self._num_iters):
+                start = time.perf_counter()
+                cur_rep_a, cur_rep_b = reprs
+                self._update_probs(
+                    reprs=reprs,
+                    probs=probs,
+                    mesh=mesh,
+                    dual_graph=dual_graph,
+                )
+                reprs = self._update_reprs(
+                    reprs=reprs,
+                    probs=probs,
+                    mesh=mesh,
+                    dual_graph=dual_graph,
+                )
+                if self._progress.enabled:
+                    self._progress.progress("clustering", iteration + 1, None)
+                    self._progress.metrics(
+                        "clustering",
+                        iteration=iteration + 1,
+                        seconds=time.perf_counter() - start,
+                    )
+                # If no updates
+                if cur_rep_a == reprs[0] and cur_rep_b == reprs[1]:
+                    break
 
         logging.info(
             "Fuzzy segmentation memberships updated, get fuzzy decompose."
@@ -191,10 +387,70 @@ class BinarySegmenter:
         # TODO: fuzziness on borders
         logging.info("Segment colours update completed.")
 
+    def _form_component_clusters(
+        self, faces: list[Face], mesh: Mesh, dual_graph: DualGraph
+    ) -> dict[Face, list[float]]:
+        """Form clusters inside one connected component of the mesh."""
+        if len(faces) < 2:
+            # Nothing to split
+            return {face: [1.0, 0.0] for face in faces}
+
+        return self._form_clusters(
+            mesh=Mesh(vertices=mesh.vertices, faces=faces),
+            dual_graph=dual_graph,
+        )
+
+    def memberships(
+        self, mesh: Mesh, dual_graph: DualGraph
+    ) -> dict[Face, list[float]]:
+        """Fuzzy memberships of every face in the 2 clusters.
+
+        Connected components are clustered independently and in parallel,
+        distances between them are infinite and carry no information. The
+        workers are split between the components running at once.
+        """
+        components = dual_graph.split_components(mesh.faces)
+        if len(components) == 1:
+            return self._form_component_clusters(
+                faces=components[0], mesh=mesh, dual_graph=dual_graph
+            )
+
+        logging.info(f"Clustering {len(components)} components separately.")
+        num_parallel = min(self._num_workers, len(components))
+        # Pools of every component share the workers, instead of each one
+        # starting num_workers threads of its own
+        component_segmenter = copy(self)
+        component_segmenter._num_workers = max(
+            1, self._num_workers // num_parallel
+        )
+        probs: dict[Face, list[float]] = {}
+        with ThreadPoolExecutor(max_workers=num_parallel) as executor:
+            for component_probs in executor.map(
+                partial(
+                    component_segmenter._form_component_clusters,
+                    mesh=mesh,
+                    dual_graph=dual_graph,
+                ),
+                components,
+            ):
+                probs.update(component_probs)
+
+        return probs
+
+    def colour_segments(
+        self, mesh: Mesh, probs: dict[Face, list[float]]
+    ) -> Mesh:
+        """Copy of the mesh, coloured according to the memberships."""
+        mesh = deepcopy(mesh)
+        self._update_segment_colours(mesh=mesh, probs=probs)
+
+        return mesh
+
     def __call__(self, mesh: Mesh, dual_graph: DualGraph) -> Mesh:
         """Segmented mesh with coloured seg  ments."""
-        mesh, dual_graph = deepcopy(mesh), deepcopy(dual_graph)
-        probs = self._form_clusters(mesh=mesh, dual_graph=dual_graph)
+        # Dual graph is only read, so it is not copied
+        mesh = deepcopy(mesh)
+        probs = self.memberships(mesh=mesh, dual_graph=dual_graph)
         self._update_segment_colours(mesh=mesh, probs=probs)
 
         return mesh
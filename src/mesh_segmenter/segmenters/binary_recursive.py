@@ -1,98 +1,195 @@
-from concurrent.futures import ThreadPoolExecutor
-from collections import Counter
-import random
 import multiprocessing
 import logging
+from copy import deepcopy
+from dataclasses import dataclass
+from typing import Callable, Optional
+
+import numpy as np
 
 from mesh_segmenter.utils.mesh import Mesh, Face
+from mesh_segmenter.cache import NodeCache
 from mesh_segmenter.graph import DualGraph
+from mesh_segmenter.progress import NO_PROGRESS, ProgressHook
 from mesh_segmenter.segmenters.binary import BinarySegmenter
 from mesh_segmenter.utils.utils import random_colours
 
 
+@dataclass
+class SegmentationTree:
+    """Recursive binary segmentation of the mesh faces.
+
+    Node k of a level is split into nodes 2k and 2k + 1 of the next one,
+    the root is node 0 of level 0 and is not stored.
+    """
+
+    # Node of every face at every level, (num_levels, num_faces)
+    labels: np.ndarray
+    # Memberships of every face in both halves of its parent node at every
+    # level, (num_levels, num_faces, 2)
+    probs: np.ndarray
+
+    @classmethod
+    def from_memberships(
+        cls, mesh: Mesh, probs: dict[Face, list[float]]
+    ) -> "SegmentationTree":
+        """Single level tree of BinarySegmenter memberships."""
+        level_probs = np.array([probs[face] for face in mesh.faces])
+        level_probs = level_probs.reshape(1, -1, 2)
+        labels = (level_probs[..., 1] > level_probs[..., 0]).astype(np.int64)
+        return cls(labels=labels, probs=level_probs)
+
+    @property
+    def num_levels(self) -> int:
+        return len(self.labels)
+
+    @property
+    def leaf_labels(self) -> np.ndarray:
+        return self.labels[-1]
+
+    def unsure(self, prob_threshold: float = 0.5) -> np.ndarray:
+        """Faces without a leaf membership above the threshold."""
+        return self.probs[-1].max(axis=1) <= prob_threshold
+
+    def node_faces(self, level: int, node: int) -> np.ndarray:
+        """Face ids of a node, level 0 is the first split."""
+        return np.flatnonzero(self.labels[level] == node)
+
+
 class BinaryRecursive:
     """Recursively call binary segmenter for more segments."""
 
     def __init__(
-        self, num_levels: int, num_workers=multiprocessing.cpu_count()
+        self,
+        num_levels: int,
+        num_workers=multiprocessing.cpu_count(),
+        prob_threshold: float = 0.5,
+        progress: ProgressHook = NO_PROGRESS,
+        segmenter_cls: Callable[..., BinarySegmenter] = BinarySegmenter,
+        node_cache: Optional[NodeCache] = None,
     ):
         # Number of sub-clusters
         self._num_levels = num_levels
         self._num_workers = num_workers
+        self._prob_threshold = prob_threshold
+        self._progress = progress
+        # Binary segmenter of every level, e.g. SpectralSegmenter
+        self._segmenter_cls = segmenter_cls
+        # Memberships of the nodes, reused by deeper runs
+        self._node_cache = node_cache
         assert num_levels > 0
 
-    def _divide_mesh(self, mesh: Mesh) -> tuple[Mesh, Mesh]:
-        """Divide a mesh into 2 parts, based on colour."""
-        # TODO: do I need to count like this? Better way?
-        # Get colours
-        colours_ctr: Counter[Face] = Counter()
-        for face in mesh.faces:
-            colours_ctr[face.colour] += 1
-
-        common_colours = colours_ctr.most_common(2)
-        assert len(common_colours) == 2, "Only one colour? Segment first"
-        colour_one, colour_two = common_colours[0][0], common_colours[1][0]
-
-        out_faces: list[list[Face]] = [[], []]
-        for face in mesh.faces:
-            if face.colour == colour_one:
-                out_faces[0].append(face)
-            elif face.colour == colour_two:
-                out_faces[1].append(face)
-            else:
-                # Randomly put into 1 or 2
-                out_faces[random.randint(0, 1)].append(face)
+    @staticmethod
+    def _segmenter_params(segmenter: BinarySegmenter) -> str:
+        """Settings of the segmenter, memberships depend on."""
+        params = sorted(segmenter.cache_params().items())
+        return f"{type(segmenter).__name__}{params}"
 
-        return (
-            Mesh(vertices=mesh.vertices, faces=out_faces[0]),
-            Mesh(vertices=mesh.vertices, faces=out_faces[1]),
-        )
+    def _node_probs(
+        self,
+        segmenter: BinarySegmenter,
+        mesh: Mesh,
+        face_ids: np.ndarray,
+        dual_graph: DualGraph,
+        cache_prefix: Optional[str] = None,
+    ) -> np.ndarray:
+        """Memberships of the node faces in its 2 halves."""
+        if cache_prefix is not None:
+            key = NodeCache.key(
+                cache_prefix, face_ids.astype(np.int64).tobytes()
+            )
+            cached = self._node_cache.get(key)
+            if cached is not None:
+                return cached
 
-    def _combine_meshes(self, meshes: list[Mesh]) -> Mesh:
-        faces = []
-        for mesh in meshes:
-            faces.extend(mesh.faces)
+        faces = [mesh.faces[idx] for idx in face_ids.tolist()]
+        probs = segmenter.memberships(
+            mesh=Mesh(vertices=mesh.vertices, faces=faces),
+            dual_graph=dual_graph,
+        )
+        node_probs = np.array([probs[face] for face in faces]).reshape(-1, 2)
+        if cache_prefix is not None:
+            self._node_cache.put(key, node_probs)
 
-        return Mesh(vertices=meshes[0].vertices, faces=faces)
+        return node_probs
 
-    def __call__(self, mesh: Mesh, dual_graph: DualGraph) -> Mesh:
-        """Recursively clusterize mesh."""
+    def segment(self, mesh: Mesh, dual_graph: DualGraph) -> SegmentationTree:
+        """Segmentation tree of the mesh faces, no colours are set."""
         logging.info(f"Segment into {self._num_levels} levels.")
-        orig_num_faces = mesh.num_faces
-        stack = [mesh]
-        level = 0
-        while stack:
+        num_faces = mesh.num_faces
+        labels = np.zeros((self._num_levels, num_faces), dtype=np.int64)
+        probs = np.zeros((self._num_levels, num_faces, 2))
+        segmenter = self._segmenter_cls(
+            num_workers=self._num_workers,
+            prob_threshold=self._prob_threshold,
+            progress=self._progress,
+        )
+        cache_prefix = None
+        if self._node_cache is not None:
+            cache_prefix = NodeCache.key(
+                mesh.content_hash(),
+                dual_graph.cache_key(),
+                self._segmenter_params(segmenter),
+            )
+        # Face ids of the nodes to split, the root is the whole mesh
+        nodes = [np.arange(num_faces)]
+        parents = np.zeros(num_faces, dtype=np.int64)
+        for level in range(self._num_levels):
             logging.info(f"Segmenting level {level + 1}")
-            colours = random_colours(num_colours=2 ** (level + 1))
-            output_meshes = []
-            idx = 0
-            # Segment submeshes of the original mesh
-            while stack:
-                mesh = stack.pop()
-                segmenter = BinarySegmenter(
-                    num_workers=self._num_workers,
-                    cluster_colors=(colours[idx * 2], colours[idx * 2 + 1]),
-                )
-                output_meshes.append(
-                    segmenter(
-                        mesh=mesh,
-                        dual_graph=dual_graph,
-                    )
+            for face_ids in nodes:
+                probs[level, face_ids] = self._node_probs(
+                    segmenter=segmenter,
+                    mesh=mesh,
+                    face_ids=face_ids,
+                    dual_graph=dual_graph,
+                    cache_prefix=cache_prefix,
                 )
-                idx += 1
 
+            # Every face goes to the half it belongs to the most, unsure
+            # ones included
+            sides = (probs[level, :, 1] > probs[level, :, 0]).astype(np.int64)
+            labels[level] = 2 * parents + sides
+            parents = labels[level]
             logging.info(f"Level {level + 1} segmented")
-            level += 1
-            # If we want to segment more
-            if level != self._num_levels:
-                for mesh in output_meshes:
-                    stack.extend(list(self._divide_mesh(mesh)))
-
-        out_mesh = self._combine_meshes(output_meshes)
-        if out_mesh.num_faces != orig_num_faces:
-            raise ValueError(
-                f"Incorrect resulted num faces,"
-                f" expected: {orig_num_faces}, got: {out_mesh.num_faces}"
-            )
+            if self._node_cache is not None:
+                logging.info(
+                    f"Node cache: {self._node_cache.hits} hits,"
+                    f" {self._node_cache.misses} misses"
+                )
+            if level + 1 < self._num_levels:
+                nodes = [
+                    child
+                    for face_ids in nodes
+                    for child in (
+                        face_ids[sides[face_ids] == 0],
+                        face_ids[sides[face_ids] == 1],
+                    )
+                    if len(child)
+                ]
 
-        return out_mesh
+        return SegmentationTree(labels=labels, probs=probs)
+
+    def colour_tree(self, mesh: Mesh, tree: SegmentationTree) -> Mesh:
+        """Copy of the mesh, coloured by the leaves of the tree.
+
+        Faces without a membership above the threshold get the sum of the
+        colours of both halves of their parent node.
+        """
+        colours = random_colours(num_colours=2**tree.num_levels)
+        leaves = tree.leaf_labels
+        unsure = tree.unsure(self._prob_threshold)
+        mesh = deepcopy(mesh)
+        for face, leaf, is_unsure in zip(
+            mesh.faces, leaves.tolist(), unsure.tolist()
+        ):
+            if not is_unsure:
+                face.set_colour(colours[leaf])
+            else:
+                sibling = leaf ^ 1
+                face.set_colour(sum((colours[leaf], colours[sibling])))
+
+        return mesh
+
+    def __call__(self, mesh: Mesh, dual_graph: DualGraph) -> Mesh:
+        """Recursively clusterize mesh."""
+        tree = self.segment(mesh=mesh, dual_graph=dual_graph)
+        return self.colour_tree(mesh=mesh, tree=tree)
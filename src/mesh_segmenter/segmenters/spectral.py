@@ -0,0 +1,126 @@
+import logging
+import multiprocessing
+
+import numpy as np
+
+from mesh_segmenter.graph import DualGraph
+from mesh_segmenter.progress import NO_PROGRESS, ProgressHook, stage
+from mesh_segmenter.segmenters.binary import BinarySegmenter
+from mesh_segmenter.utils.mesh import Mesh, Face
+from mesh_segmenter.utils.constants import (
+    MAX_NUM_ITERS,
+    COLOUR_BLUE,
+    COLOUR_RED,
+    SPECTRAL_DENSE_LIMIT,
+    SPECTRAL_SHARPNESS,
+)
+from mesh_segmenter.utils.colour import Colour
+
+
+class SpectralSegmenter(BinarySegmenter):
+    """Segments a mesh into the 2 segments with the Fiedler vector.
+
+    Affinities exp(-weight / mean weight) of the dual graph arcs form a
+    sparse normalized Laplacian, its Fiedler vector turns into fuzzy
+    memberships directly, without any distances between faces. With
+    warm_start the faces at both ends of the vector become the initial
+    representatives of the fuzzy iteration of BinarySegmenter instead.
+    """
+
+    def __init__(
+        self,
+        num_workers: int = multiprocessing.cpu_count(),
+        num_iters: int = MAX_NUM_ITERS,
+        prob_threshold: float = 0.5,
+        cluster_colors: tuple[Colour, Colour] = (COLOUR_BLUE, COLOUR_RED),
+        progress: ProgressHook = NO_PROGRESS,
+        warm_start: bool = False,
+        sharpness: float = SPECTRAL_SHARPNESS,
+        **kwargs,
+    ):
+        super().__init__(
+            num_workers=num_workers,
+            num_iters=num_iters,
+            prob_threshold=prob_threshold,
+            cluster_colors=cluster_colors,
+            progress=progress,
+            **kwargs,
+        )
+        self._warm_start = warm_start
+        self._sharpness = sharpness
+
+    def cache_params(self) -> dict:
+        return {
+            **super().cache_params(),
+            "warm_start": self._warm_start,
+            "sharpness": self._sharpness,
+        }
+
+    def _fiedler_vector(self, mesh: Mesh, dual_graph: DualGraph) -> np.ndarray:
+        """Fiedler vector of the normalized Laplacian of the mesh faces."""
+        try:
+            from scipy import sparse
+            from scipy.sparse.linalg import eigsh
+        except ImportError as err:
+            raise ImportError(
+                "Spectral segmenter needs scipy, install it with"
+                " pip install scipy"
+            ) from err
+
+        arcs_one, arcs_two, weights = dual_graph.subgraph_arcs(mesh.faces)
+        size = mesh.num_faces
+        if not len(weights):
+            return np.zeros(size)
+
+        affinity = np.exp(-weights / weights.mean())
+        adjacency = sparse.coo_matrix(
+            (affinity, (arcs_one, arcs_two)), shape=(size, size)
+        ).tocsr()
+        adjacency = adjacency + adjacency.T
+        degrees = np.asarray(adjacency.sum(axis=1)).ravel()
+        scale = sparse.diags(1.0 / np.sqrt(np.maximum(degrees, 1e-12)))
+        # Largest eigenvectors of D^-1/2 W D^-1/2 are the smallest ones of
+        # the normalized Laplacian
+        normalized = scale @ adjacency @ scale
+        if size <= SPECTRAL_DENSE_LIMIT:
+            _, vectors = np.linalg.eigh(normalized.toarray())
+            vector = vectors[:, -2]
+        else:
+            # Fixed start vector for reproducible splits
+            start = np.random.default_rng(0).random(size)
+            _, vectors = eigsh(normalized, k=2, which="LA", v0=start, tol=1e-6)
+            vector = vectors[:, 0]
+
+        return scale @ vector
+
+    def _init_reprs(self, mesh: Mesh, dual_graph: DualGraph) -> list[Face]:
+        if not self._warm_start:
+            return super()._init_reprs(mesh=mesh, dual_graph=dual_graph)
+
+        # Both ends of the Fiedler vector
+        fiedler = self._fiedler_vector(mesh=mesh, dual_graph=dual_graph)
+        return [
+            mesh.faces[int(np.argmin(fiedler))],
+            mesh.faces[int(np.argmax(fiedler))],
+        ]
+
+    def _form_clusters(
+        self, mesh: Mesh, dual_graph: DualGraph
+    ) -> dict[Face, list[float]]:
+        if self._warm_start:
+            return super()._form_clusters(mesh=mesh, dual_graph=dual_graph)
+
+        logging.info("Computing the Fiedler vector.")
+        with stage(self._progress, "spectral"):
+            fiedler = self._fiedler_vector(mesh=mesh, dual_graph=dual_graph)
+
+        # Split at zero, fuzzy band is in units of the vector spread
+        spread = fiedler.std()
+        scores = fiedler / spread if spread > 0 else fiedler
+        prob_zero = 1.0 / (1.0 + np.exp(self._sharpness * scores))
+        logging.info("Spectral memberships were formed.")
+
+        return {
+            face: [prob, 1.0 - prob]
+            for face, prob in zip(mesh.faces, prob_zero.tolist())
+        }
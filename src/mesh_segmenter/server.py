@@ -0,0 +1,530 @@
+import asyncio
+import hashlib
+import itertools
+import json
+import logging
+import multiprocessing
+import time
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Optional
+
+import numpy as np
+
+from mesh_segmenter.cache import GraphCache
+from mesh_segmenter.distances import available_memory
+from mesh_segmenter.progress import NO_PROGRESS, ProgressHook, stage
+from mesh_segmenter.results import file_hash
+from mesh_segmenter.segmenters import BinaryRecursive
+from mesh_segmenter.utils.constants import DELTA, ETA, WELD_TOLERANCE
+from mesh_segmenter.utils.utils import mesh_from_arrays, parse_ply
+
+HTTP_REASONS = {
+    200: "OK",
+    400: "Bad Request",
+    404: "Not Found",
+    413: "Payload Too Large",
+    429: "Too Many Requests",
+}
+MAX_BODY_SIZE = 512 * 1024 * 1024
+# Seconds to wait for the last stage events of a finished job
+EVENTS_FLUSH_TIMEOUT = 5.0
+
+
+class JobCancelled(Exception):
+    """Raised inside a worker process, when its job was cancelled."""
+
+
+# Worker process state, kept warm between the jobs
+_graph_cache: Optional[GraphCache] = None
+_cancelled_jobs = None
+_job_events = None
+
+
+class JobProgress(ProgressHook):
+    """Sends stage timings of a job to the server as they happen.
+
+    Cancellation is checked at every stage start and progress tick, so a
+    cancelled job stops within a clustering iteration or a batch of rows.
+    """
+
+    def __init__(self, job_id: int, events) -> None:
+        self._job_id = job_id
+        self._events = events
+
+    def stage_start(self, stage: str, total: Optional[int] = None) -> None:
+        _check_cancelled(self._job_id)
+
+    def progress(self, stage: str, done: int, total: Optional[int]) -> None:
+        _check_cancelled(self._job_id)
+
+    def stage_end(self, stage: str, seconds: float) -> None:
+        self._events.put(
+            (
+                self._job_id,
+                {
+                    "event": "stage",
+                    "job_id": self._job_id,
+                    "stage": stage,
+                    "seconds": seconds,
+                },
+            )
+        )
+
+
+def _init_worker(
+    cache_size: int, memory_budget: int, cancelled_jobs, job_events
+) -> None:
+    global _graph_cache, _cancelled_jobs, _job_events
+    _graph_cache = GraphCache(max_size=cache_size, memory_budget=memory_budget)
+    _cancelled_jobs = cancelled_jobs
+    _job_events = job_events
+
+
+def _warm_up() -> int:
+    return multiprocessing.current_process().pid
+
+
+def _mesh_key(request: dict) -> str:
+    """Hash of the mesh of a job request, equal for repeated meshes."""
+    if "path" in request:
+        path = Path(request["path"])
+        try:
+            return file_hash(path)
+        except OSError:
+            # Worker reports the missing file
+            return hashlib.sha1(str(path).encode()).hexdigest()
+
+    arrays = json.dumps([request["vertices"], request["faces"]])
+    return hashlib.sha1(arrays.encode()).hexdigest()
+
+
+def _check_cancelled(job_id: int) -> None:
+    if _cancelled_jobs is not None and job_id in _cancelled_jobs:
+        raise JobCancelled(f"Job {job_id} was cancelled")
+
+
+def run_job(job_id: int, request: dict, num_threads: int) -> dict:
+    """Segment a mesh of the job request, runs inside a worker process.
+
+    Stage timings are sent to the server as they end, cancellation is
+    checked by the progress hook at the stage boundaries. Labels and the
+    unsure mask are given for every face of the request, duplicate faces
+    get the label of their twin and degenerate faces are labelled -1.
+    """
+    progress: ProgressHook = NO_PROGRESS
+    if _job_events is not None:
+        progress = JobProgress(job_id=job_id, events=_job_events)
+    try:
+        return _run_job(request, num_threads, progress)
+    finally:
+        # Marks the end of the stage events of the job
+        if _job_events is not None:
+            _job_events.put((job_id, None))
+
+
+def _run_job(request: dict, num_threads: int, progress: ProgressHook) -> dict:
+    weld_tolerance = request.get("weld_tolerance", WELD_TOLERANCE)
+    with stage(progress, "load"):
+        if "path" in request:
+            mesh = parse_ply(
+                ply_path=Path(request["path"]), weld_tolerance=weld_tolerance
+            )
+        else:
+            mesh = mesh_from_arrays(
+                vertices=request["vertices"],
+                faces=request["faces"],
+                weld_tolerance=weld_tolerance,
+            )
+
+    with stage(progress, "graph"):
+        dual_graph, cache_hit = _graph_cache.get(
+            mesh,
+            delta=request.get("delta", DELTA),
+            eta=request.get("eta", ETA),
+            num_workers=num_threads,
+            progress=progress,
+        )
+
+    prob_threshold = request.get("prob_threshold", 0.5)
+    with stage(progress, "segment"):
+        segmenter = BinaryRecursive(
+            num_levels=request.get("num_levels", 1),
+            num_workers=num_threads,
+            prob_threshold=prob_threshold,
+            progress=progress,
+        )
+        tree = segmenter.segment(mesh=mesh, dual_graph=dual_graph)
+
+    source_face_map = mesh.source_face_map
+    if source_face_map is None:
+        source_face_map = np.arange(mesh.num_faces)
+    kept = source_face_map >= 0
+    labels = np.where(kept, tree.leaf_labels[source_face_map], -1)
+    unsure = kept & tree.unsure(prob_threshold)[source_face_map]
+
+    return {
+        "num_faces": mesh.num_faces,
+        "graph_cache_hit": cache_hit,
+        "labels": labels.tolist(),
+        "unsure": unsure.tolist(),
+    }
+
+
+@dataclass
+class Job:
+    id: int
+    request: dict
+    events: asyncio.Queue = field(default_factory=asyncio.Queue)
+    submitted: float = field(default_factory=time.perf_counter)
+    started: bool = False
+    cancelled: bool = False
+    # Set when the worker sent all the stage events of the job
+    events_flushed: asyncio.Event = field(default_factory=asyncio.Event)
+
+
+async def _read_request(
+    reader: asyncio.StreamReader,
+) -> tuple[str, str, bytes]:
+    """Read a HTTP/1.1 request: method, path and body."""
+    request_line = (await reader.readline()).decode("latin-1").strip()
+    parts = request_line.split()
+    if len(parts) != 3:
+        raise ValueError(f"Invalid request line: {request_line}")
+    method, path, _ = parts
+
+    headers = {}
+    while line := (await reader.readline()).decode("latin-1").strip():
+        name, _, value = line.partition(":")
+        headers[name.strip().lower()] = value.strip()
+
+    content_length = int(headers.get("content-length", 0))
+    if content_length > MAX_BODY_SIZE:
+        raise OverflowError(f"Body of {content_length} bytes is too large")
+    body = await reader.readexactly(content_length) if content_length else b""
+
+    return method, path, body
+
+
+async def _write_response(
+    writer: asyncio.StreamWriter,
+    status: int,
+    payload: dict,
+    headers: Optional[dict[str, str]] = None,
+) -> None:
+    body = json.dumps(payload).encode()
+    lines = [
+        f"HTTP/1.1 {status} {HTTP_REASONS[status]}",
+        "Content-Type: application/json",
+        f"Content-Length: {len(body)}",
+        "Connection: close",
+    ]
+    lines.extend(f"{name}: {value}" for name, value in (headers or {}).items())
+    writer.write(("\r\n".join(lines) + "\r\n\r\n").encode() + body)
+    await writer.drain()
+
+
+class SegmentationServer:
+    """Local segmentation daemon with warm workers and a bounded job queue.
+
+    Jobs are posted as JSON to /jobs, either {"path": "<mesh.ply>"} or
+    {"vertices": [[x, y, z], ...], "faces": [[i, j, k], ...]}, optionally
+    with num_levels, delta, eta, prob_threshold and weld_tolerance. The
+    response streams JSON lines: accepted, started, stage timings as the
+    stages end and the result with per-face leaf labels and a mask of the
+    unsure faces. DELETE /jobs/<id> cancels a job, GET /status reports
+    the queue. A full queue is answered with 429.
+
+    Every worker process has its own job queue and graph cache, jobs are
+    routed by the hash of their mesh, so repeated meshes find their dual
+    graph in the cache. The memory budget, available RAM if not given, is
+    split between the graphs all workers may cache.
+    """
+
+    def __init__(
+        self,
+        num_workers: int = multiprocessing.cpu_count(),
+        num_threads: int = 1,
+        queue_size: int = 16,
+        cache_size: int = 4,
+        memory_budget: Optional[int] = None,
+    ) -> None:
+        self._num_workers = num_workers
+        self._num_threads = num_threads
+        self._queue_size = queue_size
+        self._cache_size = cache_size
+        self._memory_budget = memory_budget
+        self._job_ids = itertools.count(1)
+        self._jobs: dict[int, Job] = {}
+        self._queues: list[asyncio.Queue] = []
+        self._executors: list[ProcessPoolExecutor] = []
+        self._cancelled_jobs = None
+        self._job_events = None
+
+    async def serve(
+        self,
+        host: str = "127.0.0.1",
+        port: int = 8765,
+        unix_socket: Optional[Path] = None,
+    ) -> None:
+        """Start the workers and serve until cancelled."""
+        loop = asyncio.get_running_loop()
+        manager = multiprocessing.Manager()
+        self._cancelled_jobs = manager.dict()
+        self._job_events = manager.Queue()
+        memory_budget = self._memory_budget or available_memory()
+        graph_budget = memory_budget // (self._num_workers * self._cache_size)
+        logging.info(
+            f"Distances of every cached graph may use"
+            f" {graph_budget / 1024**2:.1f}MB"
+        )
+        self._queues = [asyncio.Queue() for _ in range(self._num_workers)]
+        self._executors = [
+            ProcessPoolExecutor(
+                max_workers=1,
+                initializer=_init_worker,
+                initargs=(
+                    self._cache_size,
+                    graph_budget,
+                    self._cancelled_jobs,
+                    self._job_events,
+                ),
+            )
+            for _ in range(self._num_workers)
+        ]
+        # Start all worker processes now, not on the first jobs
+        pids = await asyncio.gather(
+            *[
+                loop.run_in_executor(executor, _warm_up)
+                for executor in self._executors
+            ]
+        )
+        logging.info(f"Workers are ready: {sorted(pids)}")
+        consumers = [
+            asyncio.create_task(self._consume(queue, executor))
+            for queue, executor in zip(self._queues, self._executors)
+        ]
+        forwarding = asyncio.create_task(self._forward_events())
+
+        if unix_socket is not None:
+            server = await asyncio.start_unix_server(
+                self._handle, path=str(unix_socket)
+            )
+            logging.info(f"Serving on unix socket {unix_socket}")
+        else:
+            server = await asyncio.start_server(self._handle, host, port)
+            logging.info(f"Serving on http://{host}:{port}")
+
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            for consumer in consumers:
+                consumer.cancel()
+            # Wakes up the thread waiting for events
+            self._job_events.put(None)
+            await forwarding
+            for executor in self._executors:
+                executor.shutdown(wait=False, cancel_futures=True)
+            manager.shutdown()
+
+    def cancel(self, job_id: int) -> bool:
+        """Cancel a queued or running job, False if it is unknown."""
+        job = self._jobs.get(job_id)
+        if job is None or job.cancelled:
+            return False
+
+        job.cancelled = True
+        if job.started:
+            # Worker stops at the next stage boundary
+            self._cancelled_jobs[job_id] = True
+        else:
+            # Consumer will skip it
+            job.events.put_nowait({"event": "cancelled", "job_id": job_id})
+            job.events.put_nowait(None)
+
+        return True
+
+    async def _forward_events(self) -> None:
+        """Pass stage events from the workers to the streams of the jobs."""
+        loop = asyncio.get_running_loop()
+        while item := await loop.run_in_executor(None, self._job_events.get):
+            job_id, event = item
+            job = self._jobs.get(job_id)
+            if job is None:
+                continue
+            if event is None:
+                job.events_flushed.set()
+            elif not job.cancelled:
+                job.events.put_nowait(event)
+
+    def _num_queued(self) -> int:
+        return sum(queue.qsize() for queue in self._queues)
+
+    async def _consume(
+        self, queue: asyncio.Queue, executor: ProcessPoolExecutor
+    ) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            job = await queue.get()
+            if job.cancelled:
+                self._jobs.pop(job.id, None)
+                queue.task_done()
+                continue
+
+            job.started = True
+            job.events.put_nowait(
+                {
+                    "event": "started",
+                    "job_id": job.id,
+                    "queue_seconds": time.perf_counter() - job.submitted,
+                }
+            )
+            try:
+                result = await loop.run_in_executor(
+                    executor,
+                    run_job,
+                    job.id,
+                    job.request,
+                    self._num_threads,
+                )
+            except JobCancelled:
+                job.events.put_nowait({"event": "cancelled", "job_id": job.id})
+            except Exception as err:
+                job.events.put_nowait(
+                    {"event": "error", "job_id": job.id, "message": str(err)}
+                )
+            else:
+                # Stage events come separately, they go before the result
+                try:
+                    await asyncio.wait_for(
+                        job.events_flushed.wait(), EVENTS_FLUSH_TIMEOUT
+                    )
+                except asyncio.TimeoutError:
+                    logging.warning(f"Stage events of job {job.id} are lost")
+                if job.cancelled:
+                    job.events.put_nowait(
+                        {"event": "cancelled", "job_id": job.id}
+                    )
+                else:
+                    job.events.put_nowait(
+                        {
+                            "event": "result",
+                            "job_id": job.id,
+                            "total_seconds": time.perf_counter()
+                            - job.submitted,
+                            **result,
+                        }
+                    )
+            finally:
+                job.events.put_nowait(None)
+                self._jobs.pop(job.id, None)
+                self._cancelled_jobs.pop(job.id, None)
+                queue.task_done()
+
+    async def _handle(
+        self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter
+    ) -> None:
+        try:
+            try:
+                method, path, body = await _read_request(reader)
+            except OverflowError as err:
+                await _write_response(writer, 413, {"error": str(err)})
+                return
+            except (ValueError, asyncio.IncompleteReadError) as err:
+                await _write_response(writer, 400, {"error": str(err)})
+                return
+
+            if method == "POST" and path == "/jobs":
+                await self._submit(body, writer)
+            elif method == "DELETE" and path.startswith("/jobs/"):
+                job_id = path.rsplit("/", 1)[-1]
+                cancelled = job_id.isdigit() and self.cancel(int(job_id))
+                await _write_response(
+                    writer, 200 if cancelled else 404, {"cancelled": cancelled}
+                )
+            elif method == "GET" and path == "/status":
+                await _write_response(
+                    writer,
+                    200,
+                    {
+                        "queued": self._num_queued(),
+                        "queue_size": self._queue_size,
+                        "jobs": len(self._jobs),
+                        "workers": self._num_workers,
+                    },
+                )
+            else:
+                await _write_response(writer, 404, {"error": "Unknown path"})
+        except ConnectionError:
+            logging.info("Client disconnected")
+        finally:
+            writer.close()
+
+    async def _submit(self, body: bytes, writer: asyncio.StreamWriter) -> None:
+        try:
+            request = json.loads(body)
+            if "path" not in request and not (
+                "vertices" in request and "faces" in request
+            ):
+                raise ValueError("Job needs a path or vertices and faces")
+        except (ValueError, TypeError) as err:
+            await _write_response(writer, 400, {"error": str(err)})
+            return
+
+        loop = asyncio.get_running_loop()
+        mesh_key = await loop.run_in_executor(None, _mesh_key, request)
+        if self._num_queued() >= self._queue_size:
+            # Backpressure, client should retry later
+            await _write_response(
+                writer,
+                429,
+                {"error": "Job queue is full"},
+                headers={"Retry-After": "1"},
+            )
+            return
+
+        job = Job(id=next(self._job_ids), request=request)
+        self._queues[int(mesh_key, 16) % self._num_workers].put_nowait(job)
+        self._jobs[job.id] = job
+
+        writer.write(
+            b"HTTP/1.1 200 OK\r\n"
+            b"Content-Type: application/x-ndjson\r\n"
+            b"Transfer-Encoding: chunked\r\n"
+            b"Connection: close\r\n\r\n"
+        )
+        event = {
+            "event": "accepted",
+            "job_id": job.id,
+            "queued": self._num_queued(),
+        }
+        try:
+            while event is not None:
+                chunk = (json.dumps(event) + "\n").encode()
+                writer.write(f"{len(chunk):x}\r\n".encode() + chunk + b"\r\n")
+                await writer.drain()
+                event = await job.events.get()
+            writer.write(b"0\r\n\r\n")
+            await writer.drain()
+        except ConnectionError:
+            # Nobody waits for the result anymore
+            self.cancel(job.id)
+            raise
+
+
+def serve(
+    host: str = "127.0.0.1",
+    port: int = 8765,
+    unix_socket: Optional[Path] = None,
+    **server_kwargs,
+) -> None:
+    """Run the segmentation server until interrupted."""
+    server = SegmentationServer(**server_kwargs)
+    try:
+        asyncio.run(
+            server.serve(host=host, port=port, unix_socket=unix_socket)
+        )
+    except KeyboardInterrupt:
+        logging.info("Server stopped")
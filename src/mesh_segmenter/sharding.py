@@ -0,0 +1,386 @@
+import logging
+import multiprocessing
+import os
+import queue
+import socket
+import threading
+import time
+from collections import deque
+from multiprocessing.connection import (
+    Client,
+    Connection,
+    Listener,
+    answer_challenge,
+    deliver_challenge,
+    wait,
+)
+from typing import Callable, Optional, Union
+
+import numpy as np
+
+from mesh_segmenter.distances import DistanceStore
+from mesh_segmenter.progress import NO_PROGRESS, ProgressHook, stage
+from mesh_segmenter.shortest_paths import CsrGraph, distance_rows
+from mesh_segmenter.utils.constants import (
+    SHARD_SIZE,
+    WORKER_TIMEOUT,
+    ShortestPaths,
+)
+
+Address = Union[tuple[str, int], str]
+
+POLL_INTERVAL = 0.5  # Seconds between checks for new and dead workers
+HANDSHAKE_TIMEOUT = 10.0  # Seconds a connecting worker has to authenticate
+# Busy workers are given up after this many times the slowest shard, if
+# that is longer than the worker timeout
+SHARD_TIMEOUT_FACTOR = 4.0
+
+
+def parse_address(address: str) -> Address:
+    """host:port as a TCP address, anything else as a unix socket path."""
+    host, sep, port = address.rpartition(":")
+    if sep and port.isdigit():
+        return host or "127.0.0.1", int(port)
+
+    return address
+
+
+def _worker_shortest_paths(shortest_paths: ShortestPaths) -> ShortestPaths:
+    """Heap shortest paths if the coordinator chose scipy ones, but this
+    host has no scipy, both are exact."""
+    if shortest_paths != ShortestPaths.scipy:
+        return shortest_paths
+
+    try:
+        import scipy.sparse.csgraph  # noqa: F401
+    except ImportError:
+        logging.warning("scipy is not installed, heap shortest paths are used")
+        return ShortestPaths.heap
+
+    return shortest_paths
+
+
+def run_worker(address: Address, authkey: bytes) -> int:
+    """Compute distance shards for a coordinator until it is done.
+
+    The coordinator sends the component graphs once, then shards as
+    (component, local source ids), and None at the end.
+    Every shard is answered with its rows, failures with a message.
+    """
+    num_shards = 0
+    with Client(address, authkey=authkey) as conn:
+        arrays, shortest_paths, n_smallest = conn.recv()
+        graphs = [CsrGraph(*graph_arrays) for graph_arrays in arrays]
+        shortest_paths = _worker_shortest_paths(shortest_paths)
+        logging.info(f"Distance worker connected to {address}")
+        try:
+            while (shard := conn.recv()) is not None:
+                component, sources = shard
+                try:
+                    rows = distance_rows(
+                        graphs[component],
+                        sources,
+                        shortest_paths=shortest_paths,
+                        n_smallest=n_smallest,
+                    )
+                except Exception as err:
+                    conn.send(f"{type(err).__name__}: {err}")
+                    raise
+                conn.send(rows)
+                num_shards += 1
+        except EOFError:
+            logging.warning("Coordinator closed the connection")
+
+    logging.info(f"Distance worker finished {num_shards} shards")
+    return num_shards
+
+
+def _shutdown(conn: Connection) -> None:
+    """Wake up a thread blocked reading the connection."""
+    try:
+        with socket.socket(fileno=os.dup(conn.fileno())) as sock:
+            sock.shutdown(socket.SHUT_RDWR)
+    except OSError:
+        pass
+
+
+def _authenticate(
+    conn: Connection,
+    authkey: bytes,
+    connections: queue.Queue,
+    stopped: threading.Event,
+    timeout: float,
+) -> None:
+    """Handshake of a single connection, silent clients are cut off."""
+    lock = threading.Lock()
+    finished = False
+
+    def expire() -> None:
+        with lock:
+            if not finished:
+                _shutdown(conn)
+
+    timer = threading.Timer(timeout, expire)
+    timer.start()
+    try:
+        deliver_challenge(conn, authkey)
+        answer_challenge(conn, authkey)
+    except multiprocessing.AuthenticationError:
+        logging.warning("Distance worker with a wrong authkey rejected")
+        conn.close()
+        return
+    except (EOFError, OSError):
+        logging.warning(
+            f"Distance worker did not authenticate in {timeout}s, rejected"
+        )
+        conn.close()
+        return
+    finally:
+        with lock:
+            finished = True
+        timer.cancel()
+
+    if stopped.is_set():
+        conn.close()
+    else:
+        connections.put(conn)
+
+
+def _accept(
+    listener: Listener,
+    authkey: bytes,
+    connections: queue.Queue,
+    stopped: threading.Event,
+) -> None:
+    # Listener does no handshake, every connection is authenticated in its
+    # own thread, so a silent client does not block the others
+    while not stopped.is_set():
+        try:
+            conn = listener.accept()
+        except OSError:
+            return
+        if stopped.is_set():
+            conn.close()
+            return
+        threading.Thread(
+            target=_authenticate,
+            args=(conn, authkey, connections, stopped, HANDSHAKE_TIMEOUT),
+            daemon=True,
+        ).start()
+
+
+class ShardedDistances:
+    """Fills distance stores with rows computed by worker processes.
+
+    Source faces are split into shards. Workers connect to the listener
+    with multiprocessing connections, either on other hosts (segment_mesh
+    worker) or as local processes started here. Each one gets the
+    compact component graphs once and then one shard at a time. Shards of
+    workers which die, fail or stay silent for too long are given to the
+    others, and those workers are dropped.
+    """
+
+    def __init__(
+        self,
+        address: Address = ("127.0.0.1", 0),
+        authkey: Optional[bytes] = None,
+        num_local_workers: int = 0,
+        shard_size: int = SHARD_SIZE,
+        worker_timeout: float = WORKER_TIMEOUT,
+    ) -> None:
+        if authkey is None:
+            authkey = multiprocessing.current_process().authkey
+        self._address = address
+        self._authkey = authkey
+        self._num_local_workers = num_local_workers
+        self._shard_size = shard_size
+        self._worker_timeout = worker_timeout
+
+    def fill(
+        self,
+        graphs: list[CsrGraph],
+        stores: list[DistanceStore],
+        sources: Optional[list[np.ndarray]] = None,
+        shortest_paths: ShortestPaths = ShortestPaths.heap,
+        n_smallest: Optional[int] = None,
+        progress: ProgressHook = NO_PROGRESS,
+        on_rows: Optional[Callable[[int, np.ndarray], None]] = None,
+    ) -> None:
+        """Compute rows of every component graph into its store.
+
+        All the rows if sources are not given, otherwise the given local
+        ids per component. on_rows is called with every stored shard.
+        """
+        if sources is None:
+            sources = [np.arange(graph.size) for graph in graphs]
+        shards = deque(
+            (component, ids[start : start + self._shard_size])
+            for component, ids in enumerate(sources)
+            for start in range(0, len(ids), self._shard_size)
+        )
+        num_shards = len(shards)
+        payload = (
+            [(graph.indptr, graph.indices, graph.weights) for graph in graphs],
+            shortest_paths,
+            n_smallest,
+        )
+        with Listener(self._address) as listener:
+            logging.info(
+                f"Serving {num_shards} distance shards on {listener.address}"
+            )
+            connections: queue.Queue = queue.Queue()
+            stopped = threading.Event()
+            accepting = threading.Thread(
+                target=_accept,
+                args=(listener, self._authkey, connections, stopped),
+                daemon=True,
+            )
+            accepting.start()
+            processes = [
+                multiprocessing.Process(
+                    target=run_worker,
+                    args=(listener.address, self._authkey),
+                    daemon=True,
+                )
+                for _ in range(self._num_local_workers)
+            ]
+            for process in processes:
+                process.start()
+
+            idle: list[Connection] = []
+            busy: dict[Connection, tuple[tuple[int, np.ndarray], float]] = {}
+            try:
+                with stage(progress, "distances", total=num_shards):
+                    self._serve_shards(
+                        shards=shards,
+                        stores=stores,
+                        payload=payload,
+                        connections=connections,
+                        idle=idle,
+                        busy=busy,
+                        progress=progress,
+                        on_rows=on_rows,
+                    )
+            finally:
+                for conn in idle + list(busy):
+                    try:
+                        conn.send(None)
+                    except OSError:
+                        pass
+                    conn.close()
+                # Wake up the accepting thread, so it sees the stop
+                stopped.set()
+                try:
+                    Client(listener.address).close()
+                except OSError:
+                    pass
+                accepting.join()
+                while not connections.empty():
+                    connections.get_nowait().close()
+                for process in processes:
+                    process.join()
+
+        logging.info("Sharded distances calculated")
+
+    def _serve_shards(
+        self,
+        shards: deque,
+        stores: list[DistanceStore],
+        payload: tuple,
+        connections: queue.Queue,
+        idle: list[Connection],
+        busy: dict[Connection, tuple[tuple[int, np.ndarray], float]],
+        progress: ProgressHook,
+        on_rows: Optional[Callable[[int, np.ndarray], None]],
+    ) -> None:
+        num_shards = len(shards)
+        done = 0
+        last_worker = time.monotonic()
+        # Longest time a worker took for a shard
+        slowest = 0.0
+        last_error = None
+        while done < num_shards:
+            # Newly connected workers get the graphs first
+            while not connections.empty():
+                conn = connections.get_nowait()
+                try:
+                    conn.send(payload)
+                except OSError:
+                    conn.close()
+                    continue
+                idle.append(conn)
+
+            while idle and shards:
+                conn = idle.pop()
+                shard = shards.popleft()
+                try:
+                    conn.send(shard)
+                except OSError:
+                    shards.appendleft(shard)
+                    conn.close()
+                    continue
+                busy[conn] = shard, time.monotonic()
+
+            if not busy:
+                if time.monotonic() - last_worker > self._worker_timeout:
+                    raise RuntimeError(
+                        f"No distance workers for {self._worker_timeout}s,"
+                        f" {len(shards)} shards are left"
+                        + (
+                            f", last failure: {last_error}"
+                            if last_error
+                            else ""
+                        )
+                    )
+                time.sleep(POLL_INTERVAL)
+                continue
+
+            last_worker = time.monotonic()
+            for conn in wait(list(busy), timeout=POLL_INTERVAL):
+                shard, sent = busy.pop(conn)
+                try:
+                    rows = conn.recv()
+                except (EOFError, OSError):
+                    logging.warning(
+                        f"Distance worker died, shard of {len(shard[1])}"
+                        f" rows of component {shard[0]} is reassigned"
+                    )
+                    shards.appendleft(shard)
+                    conn.close()
+                    continue
+
+                if isinstance(rows, str):
+                    logging.warning(
+                        f"Distance worker failed: {rows}, it is dropped and"
+                        f" its shard is reassigned"
+                    )
+                    last_error = rows
+                    shards.appendleft(shard)
+                    conn.close()
+                    continue
+
+                slowest = max(slowest, time.monotonic() - sent)
+                component, ids = shard
+                store = stores[component]
+                for local_idx, row in zip(ids.tolist(), rows):
+                    store.set_row(local_idx, row)
+                if on_rows is not None:
+                    on_rows(component, ids)
+                idle.append(conn)
+                done += 1
+                if progress.enabled:
+                    progress.progress("distances", done, num_shards)
+
+            # Hung workers and lost hosts never answer nor close
+            timeout = max(self._worker_timeout, SHARD_TIMEOUT_FACTOR * slowest)
+            now = time.monotonic()
+            for conn, (shard, sent) in list(busy.items()):
+                if now - sent > timeout:
+                    logging.warning(
+                        f"Distance worker silent for {timeout:.0f}s, shard of"
+                        f" {len(shard[1])} rows of component {shard[0]} is"
+                        " reassigned"
+                    )
+                    del busy[conn]
+                    shards.appendleft(shard)
+                    conn.close()
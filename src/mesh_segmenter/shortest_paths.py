@@ -0,0 +1,142 @@
+import heapq
+from dataclasses import dataclass, field
+from typing import Optional
+
+import numpy as np
+
+from mesh_segmenter.utils.constants import ShortestPaths
+
+
+@dataclass
+class CsrGraph:
+    """Undirected graph in compressed sparse rows over integer node ids.
+
+    Neighbours of every node are sorted by arc weight, so keeping only the
+    n nearest neighbours is a slice of the row.
+    """
+
+    indptr: np.ndarray
+    indices: np.ndarray
+    weights: np.ndarray
+    # Python lists of the arrays, much faster to index in the heap kernel
+    _lists: Optional[tuple[list, list, list]] = field(
+        default=None, repr=False, compare=False
+    )
+    _matrix: object = field(default=None, repr=False, compare=False)
+
+    @classmethod
+    def from_arcs(
+        cls,
+        size: int,
+        arcs_one: np.ndarray,
+        arcs_two: np.ndarray,
+        weights: np.ndarray,
+    ) -> "CsrGraph":
+        sources = np.concatenate([arcs_one, arcs_two])
+        targets = np.concatenate([arcs_two, arcs_one])
+        both_weights = np.concatenate([weights, weights])
+        order = np.lexsort((both_weights, sources))
+        indptr = np.zeros(size + 1, dtype=np.int64)
+        np.cumsum(np.bincount(sources, minlength=size), out=indptr[1:])
+        return cls(
+            indptr=indptr,
+            indices=targets[order],
+            weights=both_weights[order],
+        )
+
+    @property
+    def size(self) -> int:
+        return len(self.indptr) - 1
+
+    def lists(self) -> tuple[list, list, list]:
+        if self._lists is None:
+            self._lists = (
+                self.indptr.tolist(),
+                self.indices.tolist(),
+                self.weights.tolist(),
+            )
+        return self._lists
+
+    def to_scipy(self):
+        if self._matrix is None:
+            from scipy import sparse
+
+            self._matrix = sparse.csr_matrix(
+                (self.weights, self.indices, self.indptr),
+                shape=(self.size, self.size),
+            )
+        return self._matrix
+
+
+def dijkstra_row(
+    graph: CsrGraph,
+    source: int,
+    n_smallest: Optional[int] = None,
+    out: Optional[np.ndarray] = None,
+) -> np.ndarray:
+    """Distances from the source node to all the others.
+
+    With n_smallest only the n nearest neighbours of every node are
+    relaxed, which is faster, but overestimates some distances. The result
+    is written into out if given, unreachable nodes are inf.
+    """
+    indptr, indices, weights = graph.lists()
+    size = graph.size
+    distances = [float("inf")] * size
+    visited = bytearray(size)
+    distances[source] = 0.0
+    heap = [(0.0, source)]
+    while heap:
+        distance, node = heapq.heappop(heap)
+        if visited[node]:
+            # Stale entry, the node was reached by a shorter path already
+            continue
+        visited[node] = 1
+
+        start, end = indptr[node], indptr[node + 1]
+        if n_smallest is not None:
+            end = min(end, start + n_smallest)
+        for pos in range(start, end):
+            neighbour = indices[pos]
+            if visited[neighbour]:
+                continue
+            candidate = distance + weights[pos]
+            if candidate < distances[neighbour]:
+                distances[neighbour] = candidate
+                heapq.heappush(heap, (candidate, neighbour))
+
+    if out is None:
+        return np.array(distances)
+
+    out[:] = distances
+    return out
+
+
+def scipy_dijkstra_rows(graph: CsrGraph, sources: np.ndarray) -> np.ndarray:
+    """Distances from a batch of sources, one row per source."""
+    try:
+        from scipy.sparse.csgraph import dijkstra
+    except ImportError as err:
+        raise ImportError(
+            "scipy shortest paths need scipy, install it with"
+            " pip install scipy"
+        ) from err
+
+    # Arcs are stored in both directions already
+    return dijkstra(graph.to_scipy(), directed=True, indices=sources)
+
+
+def distance_rows(
+    graph: CsrGraph,
+    sources: np.ndarray,
+    shortest_paths: ShortestPaths = ShortestPaths.heap,
+    n_smallest: Optional[int] = None,
+) -> np.ndarray:
+    """Distances from a batch of sources with the chosen implementation."""
+    if shortest_paths == ShortestPaths.scipy:
+        return scipy_dijkstra_rows(graph, sources)
+
+    rows = np.empty((len(sources), graph.size))
+    for row, source in zip(rows, np.asarray(sources).tolist()):
+        dijkstra_row(graph, source, n_smallest=n_smallest, out=row)
+    return rows
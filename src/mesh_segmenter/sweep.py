@@ -0,0 +1,213 @@
+import itertools
+import logging
+import multiprocessing
+import time
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from typing import Optional
+
+from mesh_segmenter.graph import DualGraph
+from mesh_segmenter.segmenters import (
+    BinaryRecursive,
+    BinarySegmenter,
+    SegmentationTree,
+)
+from mesh_segmenter.utils.constants import DistanceBackend
+from mesh_segmenter.utils.mesh import Mesh
+
+
+@dataclass(frozen=True)
+class SweepSetting:
+    delta: float
+    eta: float
+    prob_threshold: float
+
+
+@dataclass
+class SweepResult:
+    setting: SweepSetting
+    mesh: Mesh
+    segment_sizes: list[int]
+    distances_time: float
+    clustering_time: float
+
+    @property
+    def total_time(self) -> float:
+        return self.distances_time + self.clustering_time
+
+
+def _segment_sizes(mesh: Mesh) -> list[int]:
+    """Number of faces per segment colour, largest first."""
+    colours_ctr = Counter(face.colour for face in mesh.faces)
+    return [count for _, count in colours_ctr.most_common()]
+
+
+# Worker process state, the shared graph is sent once per process
+_shared_graph: Optional[DualGraph] = None
+_shared_mesh: Optional[Mesh] = None
+
+
+def _init_worker(dual_graph: DualGraph, mesh: Mesh) -> None:
+    global _shared_graph, _shared_mesh
+    _shared_graph = dual_graph
+    _shared_mesh = mesh
+
+
+def _segment_pair(
+    delta: float, eta: float, num_levels: int, num_workers: int
+) -> tuple[SegmentationTree, float, float]:
+    """Segmentation tree of the shared mesh for one DELTA/ETA pair.
+
+    Only weights and distances are derived again from the shared graph.
+    Returns the tree, distances and clustering times.
+    """
+    start = time.perf_counter()
+    graph = _shared_graph.reweighted(
+        delta=delta, eta=eta, num_workers=num_workers
+    )
+    distances_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    tree = BinaryRecursive(
+        num_levels=num_levels, num_workers=num_workers
+    ).segment(mesh=_shared_mesh, dual_graph=graph)
+    return tree, distances_time, time.perf_counter() - start
+
+
+def _threshold_results(
+    mesh: Mesh,
+    tree: SegmentationTree,
+    delta: float,
+    eta: float,
+    prob_thresholds: list[float],
+    distances_time: float,
+    clustering_time: float,
+) -> list[SweepResult]:
+    """Colour the tree for every threshold, memberships are shared."""
+    results = []
+    for prob_threshold in prob_thresholds:
+        start = time.perf_counter()
+        if tree.num_levels == 1:
+            # Binary, in the colours of the binary segmenter
+            probs = dict(zip(mesh.faces, tree.probs[0].tolist()))
+            out_mesh = BinarySegmenter(
+                prob_threshold=prob_threshold
+            ).colour_segments(mesh=mesh, probs=probs)
+        else:
+            out_mesh = BinaryRecursive(
+                num_levels=tree.num_levels, prob_threshold=prob_threshold
+            ).colour_tree(mesh=mesh, tree=tree)
+
+        results.append(
+            SweepResult(
+                setting=SweepSetting(
+                    delta=delta, eta=eta, prob_threshold=prob_threshold
+                ),
+                mesh=out_mesh,
+                segment_sizes=_segment_sizes(out_mesh),
+                distances_time=distances_time,
+                clustering_time=clustering_time + time.perf_counter() - start,
+            )
+        )
+        # Distances and memberships are only paid once per DELTA/ETA pair
+        distances_time = clustering_time = 0.0
+
+    return results
+
+
+def run_sweep(
+    mesh: Mesh,
+    deltas: list[float],
+    etas: list[float],
+    prob_thresholds: tuple[float, ...] = (0.5,),
+    num_levels: int = 1,
+    num_workers: int = multiprocessing.cpu_count(),
+    dual_graph: Optional[DualGraph] = None,
+    memory_budget: Optional[int] = None,
+    distance_backend: Optional[DistanceBackend] = None,
+) -> list[SweepResult]:
+    """Segment the mesh for every DELTA/ETA/prob_threshold combination.
+
+    Adjacency and raw arc features are built once and given to every
+    worker process when it starts. Each DELTA/ETA pair only derives its own
+    weights, distances and memberships there, thresholds only colour them.
+    """
+    if dual_graph is None:
+        start = time.perf_counter()
+        dual_graph = DualGraph(
+            mesh,
+            num_workers=num_workers,
+            calculate_distances=False,
+            memory_budget=memory_budget,
+            distance_backend=distance_backend,
+        )
+        logging.info(
+            f"Shared dual graph built in {time.perf_counter() - start:.2f}s"
+        )
+
+    pairs = list(itertools.product(deltas, etas))
+    num_procs = max(1, min(num_workers, len(pairs)))
+    # Split threads between processes, so all the cores are used once
+    num_threads = max(1, num_workers // num_procs)
+    logging.info(
+        f"Sweeping {len(pairs) * len(prob_thresholds)} settings"
+        f" over {num_procs} processes."
+    )
+
+    if num_procs == 1:
+        _init_worker(dual_graph, mesh)
+        trees = [
+            _segment_pair(delta, eta, num_levels, num_threads)
+            for delta, eta in pairs
+        ]
+    else:
+        with ProcessPoolExecutor(
+            max_workers=num_procs,
+            initializer=_init_worker,
+            initargs=(dual_graph, mesh),
+        ) as executor:
+            futures = [
+                executor.submit(
+                    _segment_pair, delta, eta, num_levels, num_threads
+                )
+                for delta, eta in pairs
+            ]
+            trees = [future.result() for future in futures]
+
+    results: list[SweepResult] = []
+    for (delta, eta), (tree, distances_time, clustering_time) in zip(
+        pairs, trees
+    ):
+        results.extend(
+            _threshold_results(
+                mesh=mesh,
+                tree=tree,
+                delta=delta,
+                eta=eta,
+                prob_thresholds=list(prob_thresholds),
+                distances_time=distances_time,
+                clustering_time=clustering_time,
+            )
+        )
+
+    return results
+
+
+def format_sweep_table(results: list[SweepResult]) -> str:
+    """Plain text table with segment sizes and per-setting timings."""
+    header = (
+        f"{'delta':>8} {'eta':>8} {'threshold':>9} "
+        f"{'distances_s':>11} {'clustering_s':>12} {'total_s':>8}  segments"
+    )
+    lines = [header, "-" * len(header)]
+    for result in results:
+        setting = result.setting
+        lines.append(
+            f"{setting.delta:>8.3g} {setting.eta:>8.3g}"
+            f" {setting.prob_threshold:>9.3g}"
+            f" {result.distances_time:>11.2f} {result.clustering_time:>12.2f}"
+            f" {result.total_time:>8.2f}  {result.segment_sizes}"
+        )
+
+    return "\n".join(lines)
@@ -0,0 +1,147 @@
+import logging
+from itertools import product
+from typing import Optional
+
+import numpy as np
+
+# Cells of the hash grid are never smaller than this share of the bounding
+# box diagonal, so cell coordinates fit into int64 keys
+MIN_CELL_FRACTION = 2.0**-20
+
+
+def _cell_keys(cells: np.ndarray, spans: np.ndarray) -> np.ndarray:
+    """Single int64 key of every integer grid cell."""
+    return (cells[:, 0] * spans[1] + cells[:, 1]) * spans[2] + cells[:, 2]
+
+
+def _candidate_pairs(cells: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """Pairs of points in the same or neighbouring grid cells."""
+    # Shift, so neighbours of all the cells have non-negative coordinates
+    cells = cells - cells.min(axis=0) + 1
+    spans = cells.max(axis=0) + 2
+    keys = _cell_keys(cells, spans)
+    order = np.argsort(keys, kind="stable")
+    sorted_keys = keys[order]
+    unique_keys, starts, counts = np.unique(
+        sorted_keys, return_index=True, return_counts=True
+    )
+    unique_cells = cells[order[starts]]
+
+    firsts, seconds = [], []
+    # Half of the neighbourhood, every pair of cells is visited once
+    for offset in product((-1, 0, 1), repeat=3):
+        if offset < (0, 0, 0):
+            continue
+        neighbour_keys = _cell_keys(unique_cells + offset, spans)
+        found = np.searchsorted(unique_keys, neighbour_keys)
+        found = np.minimum(found, len(unique_keys) - 1)
+        exists = unique_keys[found] == neighbour_keys
+        cell_one = np.flatnonzero(exists)
+        cell_two = found[exists]
+        # All the pairs of points of both cells
+        num_pairs = counts[cell_one] * counts[cell_two]
+        pair_cells = np.repeat(np.arange(len(cell_one)), num_pairs)
+        within = np.arange(num_pairs.sum()) - np.repeat(
+            np.cumsum(num_pairs) - num_pairs, num_pairs
+        )
+        size_two = counts[cell_two][pair_cells]
+        one = starts[cell_one][pair_cells] + within // size_two
+        two = starts[cell_two][pair_cells] + within % size_two
+        if offset == (0, 0, 0):
+            # Same cell, pairs in one order only
+            keep = one < two
+            one, two = one[keep], two[keep]
+        firsts.append(order[one])
+        seconds.append(order[two])
+
+    return np.concatenate(firsts), np.concatenate(seconds)
+
+
+def weld_vertices(
+    points: np.ndarray, tolerance: float
+) -> tuple[np.ndarray, np.ndarray]:
+    """Merge points closer than the tolerance, in a spatial hash grid.
+
+    Returns the welded points and the new index of every original point.
+    Chains of close points are merged together, each group keeps the
+    coordinates and the position of its first point.
+    """
+    if not len(points):
+        return points, np.empty(0, dtype=np.int64)
+
+    diagonal = float(np.linalg.norm(points.max(axis=0) - points.min(axis=0)))
+    cell_size = max(tolerance, diagonal * MIN_CELL_FRACTION)
+    if cell_size <= 0:
+        # All the points coincide
+        return points[:1], np.zeros(len(points), dtype=np.int64)
+
+    cells = np.floor(points / cell_size).astype(np.int64)
+    one, two = _candidate_pairs(cells)
+    close = np.linalg.norm(points[one] - points[two], axis=1) <= tolerance
+    one, two = one[close], two[close]
+
+    # Every point points to the smallest index of its group
+    roots = np.arange(len(points))
+    while len(one):
+        lowest = np.minimum(roots[one], roots[two])
+        previous = roots.copy()
+        np.minimum.at(roots, one, lowest)
+        np.minimum.at(roots, two, lowest)
+        roots = roots[roots]
+        if np.array_equal(roots, previous):
+            break
+
+    kept, remap = np.unique(roots, return_inverse=True)
+    return points[kept], remap
+
+
+def clean_mesh_arrays(
+    points: np.ndarray,
+    faces: np.ndarray,
+    tolerance: Optional[float] = None,
+) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Weld vertices, drop degenerate and duplicate triangles.
+
+    Tolerance is absolute, None keeps the vertices as they are. Returns
+    points, faces and the index of the kept face of every original face,
+    -1 for degenerate ones. Duplicates map to their first twin, kept faces
+    keep their original order.
+    """
+    num_points, num_faces = len(points), len(faces)
+    if tolerance is not None:
+        points, remap = weld_vertices(points, tolerance=tolerance)
+        faces = remap[faces]
+
+    # Repeated vertices or no area, e.g. normals are undefined
+    corners = points[faces]
+    doubled_areas = np.linalg.norm(
+        np.cross(corners[:, 1] - corners[:, 0], corners[:, 2] - corners[:, 0]),
+        axis=1,
+    )
+    valid = (
+        (faces[:, 0] != faces[:, 1])
+        & (faces[:, 1] != faces[:, 2])
+        & (faces[:, 2] != faces[:, 0])
+        & (doubled_areas > (tolerance or 0.0) ** 2)
+    )
+    face_ids = np.flatnonzero(valid)
+
+    # Same vertices in any order, the first face is kept
+    _, first, twins = np.unique(
+        np.sort(faces[face_ids], axis=1),
+        axis=0,
+        return_index=True,
+        return_inverse=True,
+    )
+    order = np.argsort(first)
+    kept_ids = np.empty_like(order)
+    kept_ids[order] = np.arange(len(order))
+    face_map = np.full(num_faces, -1, dtype=np.int64)
+    face_map[face_ids] = kept_ids[twins.ravel()]
+    face_ids = face_ids[first[order]]
+
+    logging.info(
+        f"Mesh cleanup: {num_points - len(points)} vertices welded,"
+        f" {num_faces - len(face_ids)} degenerate or duplicate faces dropped"
+    )
+    return points, faces[face_ids], face_map
@@ -5,6 +5,26 @@ from mesh_segmenter.utils.colour import Colour
 
 class SegmenterType(Enum):
     binary = "binary"
+    spectral = "spectral"
+
+    def __str__(self):
+        return self.value
+
+
+class DistanceBackend(Enum):
+    dense = "dense"  # All-pairs in RAM
+    memmap = "memmap"  # All-pairs in a temporary file on disk
+    lazy = "lazy"  # Rows computed on demand, LRU cached
+    approximate = "approximate"  # Landmark upper bounds
+    heat = "heat"  # Heat method rows on demand, needs scipy
+
+    def __str__(self):
+        return self.value
+
+
+class ShortestPaths(Enum):
+    heap = "heap"  # Binary heap Dijkstra, supports neighbour pruning
+    scipy = "scipy"  # scipy.sparse.csgraph, batches of sources
 
     def __str__(self):
         return self.value
@@ -13,8 +33,26 @@ class SegmenterType(Enum):
 ETA = 0.01
 CONVEX_LIMIT = 3.14159265  # > 180 degree => convex
 DELTA = 0.5  # Angular and geodesic distances weighting
-DIST_N_SMALLEST = 5
+DIST_N_SMALLEST = 5  # Nearest neighbours relaxed by pruned Dijkstra
+DIJKSTRA_BATCH_SIZE = 64  # Sources per scipy shortest paths call
+SHARD_SIZE = 256  # Sources per shard of sharded distances
+WORKER_TIMEOUT = 60.0  # Seconds without workers or answers of a busy one
+CHECKPOINT_ROWS = 4096  # Distance rows between checkpoints
+WELD_TOLERANCE = 1e-6  # Vertex welding distance, in bounding box diagonals
 MAX_NUM_ITERS = 10
+# Active-set clustering
+ACTIVE_TOL = 1e-3  # Faces with smaller membership change are frozen
+FUZZY_BAND = 0.1  # Faces with |p - 0.5| below it always stay active
+OBJECTIVE_TOL = 1e-4  # Relative objective decrease to keep iterating
+CANDIDATE_FRACTION = 0.05  # Share of faces kept as representative candidates
+MIN_CANDIDATES = 32
+# Distance backend selection
+ARC_NUM_BYTES = 1024  # RAM per dual graph arc, dicts and edges included
+LAZY_MAX_FACES = 200_000  # Larger meshes use approximate distances
+NUM_LANDMARKS = 32  # Upper limit of landmarks for approximate distances
+SPECTRAL_SHARPNESS = 4.0  # Fiedler vector to memberships, in its std
+SPECTRAL_DENSE_LIMIT = 64  # Smaller problems use a dense eigensolver
+HEAT_TIME_FACTOR = 1.0  # Heat diffusion time, in mean squared arc weights
 
 COLOUR_RED = Colour(255, 0, 0)
 COLOUR_GREEN = Colour(0, 255, 0)
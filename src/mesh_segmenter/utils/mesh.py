@@ -1,6 +1,8 @@
+import hashlib
 import math
 from dataclasses import dataclass
-from typing import Union
+from functools import cached_property
+from typing import Optional, Sequence, Union
 
 from mesh_segmenter.utils.constants import Colour, COLOUR_WHITE
 
@@ -168,13 +170,25 @@ class Face:
 
 
 class Mesh:
-    def __init__(self, vertices: list[Vertex], faces: list[Face]) -> None:
+    def __init__(
+        self,
+        vertices: list[Vertex],
+        faces: list[Face],
+        source_face_map: Optional[Sequence[int]] = None,
+    ) -> None:
         self.vertices = vertices
         self.faces = faces
+        # Face of every face of the source file, -1 if dropped by cleanup
+        self.source_face_map = source_face_map
 
-        # Used for .ply outputs
-        self.id_to_vertex = {id_: vtx for id_, vtx in enumerate(self.vertices)}
-        self.vertex_to_id = {vtx: id_ for id_, vtx in enumerate(self.vertices)}
+    # Used for .ply outputs, built on first use, so submeshes are cheap
+    @cached_property
+    def id_to_vertex(self) -> dict[int, Vertex]:
+        return {id_: vtx for id_, vtx in enumerate(self.vertices)}
+
+    @cached_property
+    def vertex_to_id(self) -> dict[Vertex, int]:
+        return {vtx: id_ for id_, vtx in enumerate(self.vertices)}
 
     def get_vertex(self, id: int) -> Vertex:
         return self.id_to_vertex[id]
@@ -186,6 +200,15 @@ class Mesh:
     def num_faces(self) -> int:
         return len(self.faces)
 
+    def content_hash(self) -> str:
+        """Hash of the mesh geometry, face colours are ignored."""
+        digest = hashlib.sha1()
+        for face in self.faces:
+            vertices = "_".join(str(vtx) for vtx in face.vertices)
+            digest.update(f"{vertices};".encode())
+
+        return digest.hexdigest()
+
     @property
     def num_vertices(self) -> int:
         return len(self.vertices)
@@ -1,10 +1,15 @@
 from pathlib import Path
 import random
+from typing import Optional
 
+import numpy as np
+
+from mesh_segmenter.utils.cleanup import clean_mesh_arrays
 from mesh_segmenter.utils.mesh import Vertex, Face, Mesh
 from mesh_segmenter.utils.constants import (
     CONVEX_LIMIT,
     ETA,
+    WELD_TOLERANCE,
     COLOUR_RED,
     COLOUR_GREEN,
     COLOUR_BLUE,
@@ -19,7 +24,16 @@ ELEMENT_VERTEX = "element vertex"
 ELEMENT_FACE = "element face"
 
 
-def parse_ply(ply_path: Path) -> Mesh:
+def parse_ply(
+    ply_path: Path, weld_tolerance: Optional[float] = WELD_TOLERANCE
+) -> Mesh:
+    """Parse an ascii .ply mesh and clean it up.
+
+    Vertices closer than weld_tolerance bounding box diagonals are welded,
+    None keeps them as they are. Degenerate and duplicate faces are
+    dropped, source_face_map of the mesh gives the kept face of every face
+    of the file, the twin of duplicates and -1 for degenerate ones.
+    """
     if not ply_path.exists():
         raise FileNotFoundError(f"{str(ply_path)} file does not exist.")
 
@@ -29,9 +43,6 @@ def parse_ply(ply_path: Path) -> Mesh:
     with ply_path.open("r") as input_file:
         input_lines = input_file.readlines()
 
-    out_mesh_vertices: list[Vertex] = []
-    out_mesh_faces: list[Face] = []
-
     n_vertices = 0
     n_faces = 0
     start_idx = 0
@@ -51,38 +62,84 @@ def parse_ply(ply_path: Path) -> Mesh:
             break
 
     # Parse vertices
-    for idx in range(start_idx, start_idx + n_vertices):
-        line = input_lines[idx]
-        out_mesh_vertices.append(
-            Vertex(*[float(i) for i in line.strip().split()[:3]])
-        )
+    points = np.array(
+        [
+            line.split()[:3]
+            for line in input_lines[start_idx : start_idx + n_vertices]
+        ],
+        dtype=np.float64,
+    ).reshape(-1, 3)
 
     start_idx += n_vertices
     # Parse faces
     # We ignore any properties (as colour) on purpose
-    for idx in range(start_idx, start_idx + n_faces):
-        line = input_lines[idx]
-
-        # Assume triangles e.g 3 vx1 vx2 vx3 properties
-        line_ = line.strip().split()
-        v1_idx = line_[1]
-        v2_idx = line_[2]
-        v3_idx = line_[3]
-
-        v1 = out_mesh_vertices[int(v1_idx)]
-        v2 = out_mesh_vertices[int(v2_idx)]
-        v3 = out_mesh_vertices[int(v3_idx)]
-
-        face = Face(vertex_one=v1, vertex_two=v2, vertex_three=v3)
-        out_mesh_faces.append(face)
-
-    # TODO: check why can happen such cases?
-    # Filter out non-unique faces
-    out_mesh_faces = list(set(out_mesh_faces))
-    out_mesh = Mesh(vertices=out_mesh_vertices, faces=out_mesh_faces)
+    # Assume triangles e.g 3 vx1 vx2 vx3 properties
+    faces = np.array(
+        [
+            line.split()[1:4]
+            for line in input_lines[start_idx : start_idx + n_faces]
+        ],
+        dtype=np.int64,
+    ).reshape(-1, 3)
+
+    return _clean_mesh(points, faces, weld_tolerance=weld_tolerance)
+
+
+def _clean_mesh(
+    points: np.ndarray,
+    faces: np.ndarray,
+    weld_tolerance: Optional[float] = WELD_TOLERANCE,
+) -> Mesh:
+    """Mesh of the cleaned up arrays, see parse_ply."""
+    tolerance = None
+    if weld_tolerance is not None and len(points):
+        diagonal = np.linalg.norm(points.max(axis=0) - points.min(axis=0))
+        tolerance = weld_tolerance * float(diagonal)
+    points, faces, face_map = clean_mesh_arrays(
+        points, faces, tolerance=tolerance
+    )
+
+    out_mesh_vertices = [Vertex(*point) for point in points.tolist()]
+    out_mesh_faces = [
+        Face(
+            vertex_one=out_mesh_vertices[v1],
+            vertex_two=out_mesh_vertices[v2],
+            vertex_three=out_mesh_vertices[v3],
+        )
+        for v1, v2, v3 in faces.tolist()
+    ]
+    out_mesh = Mesh(
+        vertices=out_mesh_vertices,
+        faces=out_mesh_faces,
+        source_face_map=face_map,
+    )
     return out_mesh
 
 
+def mesh_from_arrays(
+    vertices: list[list[float]],
+    faces: list[list[int]],
+    weld_tolerance: Optional[float] = WELD_TOLERANCE,
+) -> Mesh:
+    """Form a Mesh from vertex coordinates and triangle vertex indices.
+
+    The mesh is cleaned up the same way as by parse_ply.
+    """
+    if any(len(face_ids) != 3 for face_ids in faces):
+        raise ValueError("Only triangle faces are supported")
+
+    points = np.array([vtx[:3] for vtx in vertices], dtype=np.float64).reshape(
+        -1, 3
+    )
+    face_array = np.array(faces, dtype=np.int64).reshape(-1, 3)
+    if len(face_array) and (
+        face_array.min() < 0 or face_array.max() >= len(points)
+    ):
+        raise ValueError("Face vertex indices are out of range")
+
+    return _clean_mesh(points, face_array, weld_tolerance=weld_tolerance)
+
+
 def write_ply(mesh: Mesh, out_path: Path):
     """Write ply file with vertices + vertex_indices and colours."""
     header = f"""{HEADER_START}
@@ -108,18 +165,29 @@ property list uchar int vertex_indices
         f.writelines([header, vertices_str, "\n", "\n".join(faces_str), "\n"])
 
 
-def angular_distance(face_one: Face, face_two: Face) -> float:
-    """Computes angular distance between adjacent faces."""
-    eta = 1.0
+def angular_features(face_one: Face, face_two: Face) -> tuple[float, bool]:
+    """Raw angular term between adjacent faces and whether they are convex.
 
+    Kept separate from the ETA weighting, so arc weights can be re-derived
+    for other settings without touching the mesh again.
+    """
     normal_one = face_one.normal
     normal_two = face_two.normal
 
-    if normal_one.angle(normal_two) > CONVEX_LIMIT:
+    convex = normal_one.angle(normal_two) > CONVEX_LIMIT
+    return 1 - normal_one.cos_angle(normal_two), convex
+
+
+def angular_distance(
+    face_one: Face, face_two: Face, eta: float = ETA
+) -> float:
+    """Computes angular distance between adjacent faces."""
+    ang_distance, convex = angular_features(face_one, face_two)
+    if convex:
         # Small positive
-        eta = ETA
+        return eta * ang_distance
 
-    return eta * (1 - normal_one.cos_angle(normal_two))
+    return ang_distance
 
 
 def geodesic_distance(
@@ -0,0 +1,103 @@
+from pathlib import Path
+
+import numpy as np
+
+from mesh_segmenter.graph import DualGraph
+from mesh_segmenter.utils.cleanup import clean_mesh_arrays, weld_vertices
+from mesh_segmenter.utils.utils import mesh_from_arrays, parse_ply
+
+# Unit quad of 2 triangles, every triangle with its own copy of the corners
+QUAD_POINTS = np.array(
+    [
+        [0.0, 0.0, 0.0],
+        [1.0, 0.0, 0.0],
+        [1.0, 1.0, 0.0],
+        [0.0, 0.0, 0.0],
+        [1.0, 1.0, 0.0],
+        [0.0, 1.0, 0.0],
+    ]
+)
+QUAD_FACES = np.array([[0, 1, 2], [3, 4, 5]])
+
+
+def test_weld_duplicated_quad():
+    points, remap = weld_vertices(QUAD_POINTS, tolerance=1e-9)
+    assert len(points) == 4
+    assert remap.tolist() == [0, 1, 2, 0, 2, 3]
+    np.testing.assert_array_equal(points, QUAD_POINTS[[0, 1, 2, 5]])
+
+
+def test_weld_within_tolerance_only():
+    points = np.array([[0.0, 0.0, 0.0], [0.01, 0.0, 0.0], [1.0, 0.0, 0.0]])
+    assert weld_vertices(points, tolerance=0.1)[1].tolist() == [0, 0, 1]
+    assert weld_vertices(points, tolerance=0.001)[1].tolist() == [0, 1, 2]
+
+
+def test_weld_chains_across_cells():
+    # Neighbours are closer than the tolerance, the ends are not
+    points = np.array([[0.0, 0.0, 0.0], [0.09, 0.0, 0.0], [0.18, 0.0, 0.0]])
+    welded, remap = weld_vertices(points, tolerance=0.1)
+    assert remap.tolist() == [0, 0, 0]
+    np.testing.assert_array_equal(welded, points[:1])
+
+
+def test_clean_drops_degenerate_and_duplicate_faces():
+    points = np.array(
+        [
+            [0.0, 0.0, 0.0],
+            [1.0, 0.0, 0.0],
+            [0.0, 1.0, 0.0],
+            [2.0, 0.0, 0.0],
+        ]
+    )
+    faces = np.array(
+        [
+            [0, 1, 2],
+            [0, 0, 1],  # Repeated vertex
+            [0, 1, 3],  # Collinear, no area
+            [2, 1, 0],  # Same vertices as the first one
+            [1, 3, 2],
+        ]
+    )
+    _, kept, face_map = clean_mesh_arrays(points, faces)
+    # Duplicate maps to its twin, degenerate faces to -1
+    assert face_map.tolist() == [0, -1, -1, 0, 1]
+    assert kept.tolist() == [[0, 1, 2], [1, 3, 2]]
+
+
+def test_clean_welds_before_dropping():
+    points, faces, face_map = clean_mesh_arrays(
+        QUAD_POINTS, QUAD_FACES, tolerance=1e-9
+    )
+    assert len(points) == 4
+    assert faces.tolist() == [[0, 1, 2], [0, 2, 3]]
+    assert face_map.tolist() == [0, 1]
+
+
+def test_welded_quad_is_connected():
+    # Copies of the shared corners are off by a rounding error
+    points = QUAD_POINTS + np.array([0.0, 0.0, 0.0, 1e-9, 1e-9, 0.0])[:, None]
+    mesh = mesh_from_arrays(points.tolist(), QUAD_FACES.tolist())
+    dual_graph = DualGraph(mesh, calculate_distances=False)
+    assert dual_graph.num_arcs == 1
+    assert dual_graph.num_components == 1
+
+    unwelded = mesh_from_arrays(
+        points.tolist(), QUAD_FACES.tolist(), weld_tolerance=None
+    )
+    assert unwelded.num_vertices == 6
+
+
+def test_parse_ply_keeps_source_face_map(tmp_path: Path):
+    ply_path = tmp_path / "quad.ply"
+    vertices = "\n".join(" ".join(map(str, point)) for point in QUAD_POINTS)
+    ply_path.write_text(
+        "ply\nformat ascii 1.0\nelement vertex 6\nproperty float x\n"
+        "property float y\nproperty float z\nelement face 3\n"
+        "property list uchar int vertex_indices\nend_header\n"
+        f"{vertices}\n3 0 1 2\n3 0 3 1\n3 3 4 5\n"
+    )
+    mesh = parse_ply(ply_path)
+    assert mesh.num_vertices == 4
+    assert mesh.num_faces == 2
+    assert mesh.source_face_map.tolist() == [0, -1, 1]
@@ -0,0 +1,90 @@
+import logging
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+from mesh_segmenter.distances import CheckpointedDistances
+from mesh_segmenter.graph import DualGraph
+from mesh_segmenter.utils.constants import DistanceBackend
+from mesh_segmenter.utils.utils import mesh_from_arrays
+
+
+@pytest.fixture
+def grid_mesh():
+    # 4 x 4 vertices on a bumpy plane, 18 triangles in one component
+    xs, ys = np.meshgrid(np.arange(4.0), np.arange(4.0))
+    points = np.stack([xs.ravel(), ys.ravel(), (xs * ys).ravel() % 2], 1)
+    faces = []
+    for row in range(3):
+        for col in range(3):
+            corner = 4 * row + col
+            faces.append([corner, corner + 1, corner + 5])
+            faces.append([corner, corner + 5, corner + 4])
+    return mesh_from_arrays(points.tolist(), faces)
+
+
+def _all_distances(dual_graph: DualGraph, num_faces: int) -> np.ndarray:
+    face_ids = np.arange(num_faces)
+    return np.array(
+        [dual_graph.distances_from(face_id, face_ids) for face_id in face_ids]
+    )
+
+
+def test_rows_are_marked_at_checkpoint(tmp_path: Path):
+    path = tmp_path / "rows.dist"
+    store = CheckpointedDistances(path, size=4)
+    store.set_row(0, np.arange(4.0))
+    store.mark_done(np.array([0]))
+    store.checkpoint()
+    # Written but not checkpointed, e.g. the run was killed here
+    store.set_row(1, np.arange(4.0))
+    store.mark_done(np.array([1]))
+    del store
+
+    resumed = CheckpointedDistances(path, size=4)
+    assert resumed.missing_rows.tolist() == [1, 2, 3]
+    np.testing.assert_array_equal(resumed.row(0), np.arange(4.0))
+
+
+def test_resume_computes_only_missing_rows(
+    tmp_path: Path, grid_mesh, monkeypatch, caplog
+):
+    graph_kwargs = {
+        "num_workers": 1,
+        "distance_backend": DistanceBackend.dense,
+        "checkpoint_dir": tmp_path,
+    }
+    expected = _all_distances(
+        DualGraph(grid_mesh, **graph_kwargs), grid_mesh.num_faces
+    )
+
+    # Forget the last rows, as if the run was killed before them
+    (index_path,) = tmp_path.glob("*/*.index.npy")
+    done = np.load(index_path)
+    done[12:] = False
+    np.save(index_path, done)
+
+    computed = []
+    fill_rows = DualGraph._fill_rows
+
+    def recording_fill_rows(self, component, sources):
+        computed.extend(sources.tolist())
+        fill_rows(self, component, sources)
+
+    monkeypatch.setattr(DualGraph, "_fill_rows", recording_fill_rows)
+    with caplog.at_level(logging.INFO):
+        resumed = DualGraph(grid_mesh, **graph_kwargs)
+    assert sorted(computed) == list(range(12, grid_mesh.num_faces))
+    assert "less work" in caplog.text
+    np.testing.assert_allclose(
+        _all_distances(resumed, grid_mesh.num_faces), expected
+    )
+
+    # Nothing is left to compute, so there is no speedup to report
+    computed.clear()
+    caplog.clear()
+    with caplog.at_level(logging.INFO):
+        DualGraph(grid_mesh, **graph_kwargs)
+    assert computed == []
+    assert "less work" not in caplog.text
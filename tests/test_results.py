@@ -0,0 +1,189 @@
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+from mesh_segmenter.results import (
+    SegmentationResult,
+    apply_result,
+    label_colours,
+    load_result,
+)
+from mesh_segmenter.segmenters import SegmentationTree
+from mesh_segmenter.utils.utils import parse_ply
+
+# Unit square of 4 triangles around its centre and a degenerate one
+PLY_HEADER = """ply
+format ascii 1.0
+element vertex 5
+property float x
+property float y
+property float z
+element face 5
+property list uchar int vertex_indices
+{extra}end_header
+"""
+PLY_BODY = """0 0 0
+1 0 0
+1 1 0
+0 1 0
+0.5 0.5 0
+3 0 1 4{values}
+3 1 2 4{values}
+3 0 0 1{values}
+3 2 3 4{values}
+3 3 0 4{values}
+"""
+
+
+def _write_ply(path: Path, extra: str = "", values: str = "") -> Path:
+    path.write_text(
+        PLY_HEADER.format(extra=extra) + PLY_BODY.format(values=values)
+    )
+    return path
+
+
+@pytest.fixture
+def ply_path(tmp_path: Path) -> Path:
+    return _write_ply(tmp_path / "square.ply")
+
+
+@pytest.fixture
+def tree() -> SegmentationTree:
+    labels = np.array([[0, 0, 1, 1], [0, 1, 2, 3]])
+    probs = np.array(
+        [
+            [[0.9, 0.1], [0.8, 0.2], [0.3, 0.7], [0.4, 0.6]],
+            [[0.6, 0.4], [0.1, 0.9], [0.7, 0.3], [0.2, 0.8]],
+        ]
+    )
+    return SegmentationTree(labels=labels, probs=probs)
+
+
+@pytest.fixture
+def result(ply_path: Path, tree: SegmentationTree) -> SegmentationResult:
+    mesh = parse_ply(ply_path)
+    return SegmentationResult.from_tree(
+        tree=tree,
+        mesh=mesh,
+        source_path=ply_path,
+        parameters={"num_levels": 2},
+    )
+
+
+def _face_lines(path: Path) -> list[list[str]]:
+    lines = path.read_text().splitlines()
+    start = lines.index("end_header") + 1 + 5
+    return [line.split() for line in lines[start:]]
+
+
+def test_degenerate_face_is_dropped(result):
+    assert result.source_face_map.tolist() == [0, 1, -1, 2, 3]
+
+
+def test_round_trip(tmp_path, result, tree):
+    path = tmp_path / "result.npz"
+    result.save(path)
+    loaded = load_result(path)
+
+    np.testing.assert_array_equal(loaded.hierarchy, tree.labels)
+    np.testing.assert_allclose(loaded.probs, tree.probs, rtol=1e-6)
+    np.testing.assert_array_equal(
+        loaded.source_face_map, result.source_face_map
+    )
+    assert loaded.mesh_hash == result.mesh_hash
+    assert loaded.source_hash == result.source_hash
+    assert loaded.parameters == {"num_levels": 2}
+    np.testing.assert_array_equal(loaded.to_tree().leaf_labels, [0, 1, 2, 3])
+
+
+def test_unknown_version_is_rejected(tmp_path, result):
+    path = tmp_path / "result.npz"
+    result.save(path)
+    with np.load(path) as data:
+        arrays = dict(data)
+    arrays["version"] = np.array(99)
+    np.savez(path, **arrays)
+
+    with pytest.raises(ValueError, match="version"):
+        load_result(path)
+
+
+def test_apply_adds_colours(tmp_path, ply_path, result):
+    out_path = tmp_path / "painted.ply"
+    apply_result(result, ply_path=ply_path, out_path=out_path)
+
+    text = out_path.read_text()
+    assert text.count("property uint8 red") == 1
+    colours = [str(colour).split() for colour in label_colours(4)]
+    faces = _face_lines(out_path)
+    assert [face[4:] for face in faces] == [
+        colours[0],
+        colours[1],
+        ["255", "255", "255"],  # Dropped when parsed
+        colours[2],
+        colours[3],
+    ]
+    assert faces[1][:4] == ["3", "1", "2", "4"]
+
+
+def test_apply_paints_duplicates_like_their_twin(tmp_path, tree):
+    ply_path = _write_ply(tmp_path / "duplicate.ply")
+    ply_path.write_text(
+        ply_path.read_text().replace("element face 5", "element face 6")
+        + "3 4 2 1\n"
+    )
+    mesh = parse_ply(ply_path)
+    assert mesh.source_face_map.tolist() == [0, 1, -1, 2, 3, 1]
+
+    result = SegmentationResult.from_tree(
+        tree=tree, mesh=mesh, source_path=ply_path
+    )
+    out_path = tmp_path / "painted.ply"
+    apply_result(result, ply_path=ply_path, out_path=out_path)
+
+    faces = _face_lines(out_path)
+    assert faces[5][4:] == faces[1][4:] == str(label_colours(4)[1]).split()
+    assert faces[2][4:] == ["255", "255", "255"]
+
+
+def test_apply_adds_only_missing_colours(tmp_path, tree):
+    ply_path = _write_ply(
+        tmp_path / "red.ply", extra="property uchar red\n", values=" 7"
+    )
+    result = SegmentationResult.from_tree(
+        tree=tree, mesh=parse_ply(ply_path), source_path=ply_path
+    )
+    out_path = tmp_path / "painted.ply"
+    apply_result(result, ply_path=ply_path, out_path=out_path)
+
+    header = out_path.read_text().split("end_header")[0]
+    assert header.count(" red\n") == 1
+    assert header.count(" green\n") == 1
+    assert header.count(" blue\n") == 1
+    red, green, blue = str(label_colours(4)[1]).split()
+    assert _face_lines(out_path)[1] == ["3", "1", "2", "4", red, green, blue]
+
+
+def test_apply_rejects_other_source(tmp_path, result):
+    other = _write_ply(tmp_path / "other.ply")
+    other.write_text(other.read_text().replace("0.5 0.5 0", "0.5 0.4 0"))
+
+    with pytest.raises(ValueError, match="not the mesh"):
+        apply_result(result, ply_path=other, out_path=tmp_path / "out.ply")
+
+    # Forced, labels are painted anyway
+    apply_result(
+        result,
+        ply_path=other,
+        out_path=tmp_path / "out.ply",
+        check_source=False,
+    )
+
+
+def test_apply_checks_mesh_hash(tmp_path, ply_path, result):
+    result.source_hash = None
+    result.mesh_hash = "0" * 40
+
+    with pytest.raises(ValueError, match="differs"):
+        apply_result(result, ply_path=ply_path, out_path=tmp_path / "out.ply")
@@ -0,0 +1,68 @@
+import multiprocessing
+import os
+from multiprocessing.connection import Client
+
+import numpy as np
+import pytest
+
+from mesh_segmenter import sharding
+from mesh_segmenter.distances import DenseDistances
+from mesh_segmenter.sharding import ShardedDistances
+from mesh_segmenter.shortest_paths import CsrGraph, distance_rows
+from mesh_segmenter.utils.constants import ShortestPaths
+
+
+def _random_graph(rng: np.random.Generator, size: int) -> CsrGraph:
+    arcs = {
+        tuple(sorted(pair))
+        for pair in rng.integers(0, size, size=(3 * size, 2)).tolist()
+        if pair[0] != pair[1]
+    }
+    arcs_one, arcs_two = np.array(sorted(arcs)).T
+    return CsrGraph.from_arcs(
+        size, arcs_one, arcs_two, rng.uniform(0.1, 1.0, size=len(arcs))
+    )
+
+
+@pytest.mark.parametrize("failure", ["error", "exit"])
+def test_shards_of_a_broken_worker_are_reassigned(monkeypatch, failure):
+    rng = np.random.default_rng(0)
+    graphs = [_random_graph(rng, 30), _random_graph(rng, 20)]
+    stores = [DenseDistances(graph.size) for graph in graphs]
+    started = multiprocessing.Value("i", 0)
+    broken = multiprocessing.Event()
+    run_worker = sharding.run_worker
+
+    def flaky_run_worker(address, authkey):
+        with started.get_lock():
+            index = started.value
+            started.value += 1
+        if index > 0:
+            # Healthy worker starts once the other one broke with a shard
+            broken.wait(timeout=10)
+            return run_worker(address, authkey)
+
+        with Client(address, authkey=authkey) as conn:
+            conn.recv()
+            conn.recv()
+            if failure == "error":
+                conn.send("RuntimeError: worker is broken")
+            broken.set()
+            if failure == "exit":
+                os._exit(1)
+        return 0
+
+    monkeypatch.setattr(sharding, "run_worker", flaky_run_worker)
+    sharded = ShardedDistances(
+        num_local_workers=2, shard_size=4, worker_timeout=10.0
+    )
+    sharded.fill(graphs, stores, shortest_paths=ShortestPaths.heap)
+
+    assert broken.is_set()
+    for graph, store in zip(graphs, stores):
+        expected = distance_rows(
+            graph, np.arange(graph.size), shortest_paths=ShortestPaths.heap
+        )
+        np.testing.assert_allclose(
+            [store.row(idx) for idx in range(graph.size)], expected
+        )
@@ -0,0 +1,74 @@
+import numpy as np
+import pytest
+
+from mesh_segmenter.shortest_paths import (
+    CsrGraph,
+    dijkstra_row,
+    distance_rows,
+)
+from mesh_segmenter.utils.constants import ShortestPaths
+
+
+@pytest.fixture
+def graph() -> CsrGraph:
+    # 0 - 1 - 2 - 3 path with a longer shortcut 0 - 3 and an isolated 4
+    arcs_one = np.array([0, 1, 2, 0])
+    arcs_two = np.array([1, 2, 3, 3])
+    weights = np.array([1.0, 2.0, 0.5, 4.0])
+    return CsrGraph.from_arcs(5, arcs_one, arcs_two, weights)
+
+
+def test_neighbours_are_sorted_by_weight(graph):
+    start, end = graph.indptr[0], graph.indptr[1]
+    assert graph.indices[start:end].tolist() == [1, 3]
+    assert graph.weights[start:end].tolist() == [1.0, 4.0]
+
+
+def test_heap_row(graph):
+    row = dijkstra_row(graph, 0)
+    np.testing.assert_allclose(row, [0.0, 1.0, 3.0, 3.5, np.inf])
+
+
+def test_heap_row_into_out(graph):
+    out = np.zeros(graph.size)
+    assert dijkstra_row(graph, 3, out=out) is out
+    np.testing.assert_allclose(out, [3.5, 2.5, 0.5, 0.0, np.inf])
+
+
+def test_n_smallest_only_relaxes_nearest_neighbours(graph):
+    # Nearest neighbour of 1 is 0, so 2 and 3 are never reached
+    row = dijkstra_row(graph, 0, n_smallest=1)
+    np.testing.assert_allclose(row, [0.0, 1.0, np.inf, np.inf, np.inf])
+    # Both neighbours of every node give the exact distances
+    np.testing.assert_allclose(
+        dijkstra_row(graph, 0, n_smallest=2), dijkstra_row(graph, 0)
+    )
+
+
+def test_heap_matches_scipy(graph):
+    pytest.importorskip("scipy")
+    sources = np.arange(graph.size)
+    heap = distance_rows(graph, sources, shortest_paths=ShortestPaths.heap)
+    scipy = distance_rows(graph, sources, shortest_paths=ShortestPaths.scipy)
+    np.testing.assert_allclose(heap, scipy)
+    np.testing.assert_allclose(heap, heap.T)
+
+
+def test_heap_matches_scipy_on_random_graph():
+    pytest.importorskip("scipy")
+    rng = np.random.default_rng(0)
+    size = 60
+    arcs = {
+        tuple(sorted(pair))
+        for pair in rng.integers(0, size, size=(200, 2)).tolist()
+        if pair[0] != pair[1]
+    }
+    arcs_one, arcs_two = np.array(sorted(arcs)).T
+    graph = CsrGraph.from_arcs(
+        size, arcs_one, arcs_two, rng.uniform(0.1, 1.0, size=len(arcs))
+    )
+    sources = np.arange(size)
+    np.testing.assert_allclose(
+        distance_rows(graph, sources, shortest_paths=ShortestPaths.heap),
+        distance_rows(graph, sources, shortest_paths=ShortestPaths.scipy),
+    )